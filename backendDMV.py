@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+xarray backend for SSEC DMV binary files, built around readDMV.
+
+Installing the package (pip install .) registers the 'dmv' engine with
+xarray through the xarray.backends entry point in pyproject.toml, so that
+    import xarray as xr
+    c1 = xr.open_dataset('160602C1.RNC', engine='dmv')
+    rnc = xr.open_mfdataset('AE1606*/*C1.RNC', engine='dmv', parallel=True)
+work. Without installing, give the engine directly:
+    from backendDMV import DMVBackendEntrypoint
+    c1 = xr.open_dataset('160602C1.RNC', engine=DMVBackendEntrypoint)
+
+Variables are returned lazily: records are only read from the file when
+they are indexed or loaded, and drop_variables is passed on to readDMV so
+dropped variables are never decoded.
+
+So that the datasets of several files combine along time, time_offset is a
+variable on the time dimension rather than a dimension of its own, and the
+per-file scalars FileHistory, base_time and date are global attributes
+rather than variables. In a combined dataset the attributes are those of
+the first file, and time_offset of each record still refers to the
+base_time of its own file; use time for the absolute times.
+"""
+
+import os
+import numpy as np
+from xarray.backends import BackendArray, BackendEntrypoint
+from xarray.core import indexing
+
+from readDMV import DMVFile
+
+DMVextensions = ('RNC', 'RFC', 'RLC', 'CXS', 'CXV', 'SUM')
+
+
+class DMVBackendArray(BackendArray):
+    """One column, or a block of columns, of the records of a DMV file."""
+    def __init__(self, recordArray, columns):
+        self.recordArray = recordArray
+        self.columns = columns
+        if isinstance(columns, slice):
+            self.shape = (recordArray.shape[0], len(range(*columns.indices(recordArray.shape[1]))))
+        else:
+            self.shape = (recordArray.shape[0],)
+        self.dtype = recordArray.dtype
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(key, self.shape, indexing.IndexingSupport.OUTER_1VECTOR,
+                                                  self._getitem)
+
+    def _getitem(self, key):
+        if not isinstance(self.columns, slice):
+            return self.recordArray[key[0], self.columns]
+        # Shift the column key to the position of the block within the record.
+        columns = range(*self.columns.indices(self.recordArray.shape[1]))
+        if isinstance(key[1], slice):
+            columns = columns[key[1]]
+            columns = slice(columns.start, columns.stop if columns.stop >= 0 else None, columns.step)
+        else:
+            columns = np.asarray(columns)[key[1]]
+        return self.recordArray[key[0], columns]
+
+
+class DMVBackendRecords(object):
+    """Wraps a DMVRecordArray so that slicing it returns lazily indexed variables."""
+    def __init__(self, recordArray):
+        self.recordArray = recordArray
+        self.shape = recordArray.shape
+
+    def __getitem__(self, key):
+        return indexing.LazilyIndexedArray(DMVBackendArray(self.recordArray, key[1]))
+
+
+class DMVBackendEntrypoint(BackendEntrypoint):
+    description = 'Open SSEC DMV files (RNC, RFC, RLC, CXS, CXV, SUM) in xarray'
+    url = 'https://github.com/vonw/dmvtocdf'
+    open_dataset_parameters = ('filename_or_obj', 'drop_variables')
+
+    def open_dataset(self, filename_or_obj, *, drop_variables=None):
+        ds = DMVFile(os.fspath(filename_or_obj))._read(drop_variables=drop_variables, wrapRecords=DMVBackendRecords)
+
+        # Per-file scalars become attributes, and time_offset a variable on time.
+        perFile = [name for name, variable in ds.data_vars.items() if not variable.dims]
+        for name in perFile:
+            ds.attrs[name] = ds[name].values.item()
+        ds = ds.drop_vars(perFile)
+        if ('time_offset' in ds.dims):
+            time_offset = ds['time_offset'].variable
+            ds = ds.drop_vars('time_offset')
+            ds['time_offset'] = ('time', time_offset.values, time_offset.attrs)
+
+        return ds
+
+    def guess_can_open(self, filename_or_obj):
+        try:
+            return os.fspath(filename_or_obj).split('.')[-1].upper() in DMVextensions
+        except TypeError:
+            return False
+
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of readDMV for every type of DMV file.
+
+Writes synthetic DMV files with writeDMV (or uses existing files) and
+reports, for each file and read mode, the decode throughput in records and
+megabytes per second, and the peak memory allocated while decoding. Run it
+before and after a change to catch performance regressions, or with real
+file sizes to size hardware.
+
+From Python:
+    from benchDMV import runBenchmarks
+    results = runBenchmarks(numberOfRecords=2000, modes=('eager', 'memmap'))
+
+From the command line:
+    python benchDMV.py -n 2000 -w 2048 -t C1.RNC F1.CXS .SUM
+    python benchDMV.py --files /Users/vonw/data/paeri/raw/AE160602/160602C1.RNC
+
+The times are the best of repeat reads of files that are in the page cache;
+they measure decoding, not disk speed. Every read loads and touches all of
+the values of every variable, so that all modes do the same work. The peak
+memory is the peak of the allocations that tracemalloc traces (those of
+Python and numpy) while reading; it is not the resident memory of the
+process, and does not count memory-mapped pages of the file.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+from readDMV import readDMV
+from writeDMV import DMVtypes, writeDMVfiles
+
+# Keywords of readDMV for each read mode.
+readModes = {'eager': {},
+             'memmap': {'memmap': True},
+             'lazy': {'lazy': True}}
+
+
+def benchmarkDMV(filename, mode='eager', repeat=3):
+    """
+    Benchmarks readDMV for one file and read mode (see readModes). Every
+    dataset is loaded and every value of every variable is read, so that
+    lazy and memory-mapped modes decode all of the data, like eager mode.
+
+    Output:
+        Dictionary with the file name, mode, number of records, size in MB,
+        best time in seconds, records/s, MB/s and peak traced allocations
+        in MB (not resident memory; see above).
+    """
+    def read():
+        ds = readDMV(filename, **readModes[mode]).load()
+        for variable in ds.variables.values():
+            if (variable.dtype.kind in 'biuf'):
+                np.sum(variable.values, dtype=np.float64)
+        return ds
+
+    # The first read also imports the modules and builds the cached format tables.
+    numberOfRecords = read().sizes.get('time', 0)
+    seconds = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        read()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    read()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    megabytes = os.path.getsize(filename) / 2**20
+    best = min(seconds)
+    return {'filename': filename,
+            'mode': mode,
+            'records': numberOfRecords,
+            'megabytes': megabytes,
+            'seconds': best,
+            'recordsPerSecond': numberOfRecords / best,
+            'megabytesPerSecond': megabytes / best,
+            'peakMegabytes': peak / 2**20}
+
+
+def reportBenchmark(result):
+    print('{:<24} {:<7} {:>8d} {:>9.1f} {:>9.3f} {:>11.0f} {:>9.1f} {:>9.1f}'.format(
+        os.path.basename(result['filename']), result['mode'], result['records'], result['megabytes'],
+        result['seconds'], result['recordsPerSecond'], result['megabytesPerSecond'], result['peakMegabytes']))
+
+
+def runBenchmarks(filenames=None, filetypes=DMVtypes, numberOfRecords=1000, numberOfWavenumbers=None,
+                  modes=('eager', 'memmap', 'lazy'), repeat=3, verbose=True):
+    """
+    Benchmarks readDMV for DMV files in each of modes.
+
+    Input:
+        filenames           - DMV files to benchmark; by default, synthetic files of
+                              each of filetypes are written to a temporary directory.
+        filetypes           - types of synthetic files (see writeDMV.DMVtypes)
+        numberOfRecords     - number of records of the synthetic files
+        numberOfWavenumbers - number of values of each spectrum of the synthetic files
+        modes               - read modes (see readModes)
+        repeat              - number of timed reads of each file and mode
+        verbose             - print a table of the results
+
+    Output:
+        List of result dictionaries from benchmarkDMV.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        if filenames is None:
+            filenames = writeDMVfiles(directory, filetypes=filetypes, numberOfRecords=numberOfRecords,
+                                      numberOfWavenumbers=numberOfWavenumbers)
+
+        if verbose:
+            print('{:<24} {:<7} {:>8} {:>9} {:>9} {:>11} {:>9} {:>9}'.format(
+                'file', 'mode', 'records', 'MB', 'seconds', 'records/s', 'MB/s', 'alloc MB'))
+        results = []
+        for filename in filenames:
+            for mode in modes:
+                results.append(benchmarkDMV(filename, mode, repeat))
+                if verbose: reportBenchmark(results[-1])
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark readDMV for every type of DMV file.')
+    parser.add_argument('--files', nargs='+', default=None, help='benchmark these DMV files instead of synthetic ones')
+    parser.add_argument('-t', '--types', nargs='+', default=list(DMVtypes), help='types of synthetic files, e.g. C1.RNC .SUM')
+    parser.add_argument('-n', '--records', type=int, default=1000, help='number of records of the synthetic files')
+    parser.add_argument('-w', '--wavenumbers', type=int, default=None, help='number of values of each synthetic spectrum')
+    parser.add_argument('-m', '--modes', nargs='+', default=list(readModes), choices=list(readModes), help='read modes')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of timed reads')
+    args = parser.parse_args(argv)
+
+    runBenchmarks(args.files, args.types, args.records, args.wavenumbers, args.modes, args.repeat)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite catalog of SSEC DMV files.
+
+Scans directories of DMV files in a pool of worker processes, describes
+each file with readDMV.inspectDMV (header, TOC and file size only; no data
+records are decoded) and stores the results in an SQLite database, so that
+questions like "which days have CXS files for channel 2 between 2011 and
+2013" are answered with a query instead of by opening every file.
+
+Files whose size and modification time are unchanged since they were last
+catalogued are not inspected again, so the catalog can be updated cheaply.
+
+From Python:
+    from catalogDMV import buildCatalog, queryCatalog
+    buildCatalog('/Users/vonw/data/paeri/raw', 'paeri.sqlite', workers=8)
+    days = queryCatalog('paeri.sqlite', fileType='CXS', channel='2', start='2011-01-01', end='2013-12-31')
+
+From the command line:
+    python catalogDMV.py /Users/vonw/data/paeri/raw -d paeri.sqlite -j 8
+
+The tables are
+    files       - path, fileType, channel, scanDirection, date, numberOfRecords,
+                  firstTime, lastTime (ISO 8601 strings), size and mtime
+    wavenumbers - path, variable, minimum, maximum and numberOfValues of each
+                  dependent variable
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from readDMV import inspectDMV
+from dmvtocdf import DMVextensions, findDMVfiles
+
+schema = '''
+CREATE TABLE IF NOT EXISTS files (
+    path            TEXT PRIMARY KEY,
+    fileType        TEXT,
+    channel         TEXT,
+    scanDirection   TEXT,
+    date            TEXT,
+    numberOfRecords INTEGER,
+    firstTime       TEXT,
+    lastTime        TEXT,
+    size            INTEGER,
+    mtime           REAL
+);
+CREATE INDEX IF NOT EXISTS filesByType ON files (fileType, channel, date);
+CREATE INDEX IF NOT EXISTS filesByDate ON files (date);
+CREATE TABLE IF NOT EXISTS wavenumbers (
+    path            TEXT,
+    variable        TEXT,
+    minimum         REAL,
+    maximum         REAL,
+    numberOfValues  INTEGER,
+    PRIMARY KEY (path, variable)
+);
+'''
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime)
+
+
+def _inspectDMV(path):
+    """Worker for buildCatalog; returns (path, inspectDMV(path), (size, mtime)) or (path, error message, None)."""
+    try:
+        return path, inspectDMV(path), _stat(path)
+    except Exception as e:
+        return path, '{}: {}'.format(type(e).__name__, e), None
+
+
+def _isoformat(t):
+    return None if t is None else t.isoformat()
+
+
+def buildCatalog(directories, database='dmvcatalog.sqlite', filetypes=DMVextensions, workers=None, verbose=True):
+    """
+    Adds the DMV files below one or more directories to an SQLite catalog.
+
+    Input:
+        directories - directory, or list of directories, to search for DMV files
+        database    - SQLite database file; created if it does not exist
+        filetypes   - DMV file types (extensions) to catalog
+        workers     - number of worker processes (default: number of CPUs)
+        verbose     - print the files that could not be inspected and a summary
+
+    Output:
+        Number of files that were (re)catalogued.
+    """
+    if isinstance(directories, str):
+        directories = [directories]
+    paths = []
+    for directory in directories:
+        paths.extend(os.path.abspath(path) for path in findDMVfiles(directory, filetypes))
+
+    connection = sqlite3.connect(database)
+    connection.executescript(schema)
+    known = dict((path, (size, mtime)) for path, size, mtime in connection.execute('SELECT path, size, mtime FROM files'))
+    unchanged = len(paths)
+    paths = [path for path in paths if known.get(path) != _stat(path)]
+    unchanged -= len(paths)
+
+    catalogued = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, info, stat in pool.map(_inspectDMV, paths, chunksize=16):
+            if stat is None:
+                failed += 1
+                if verbose: print('FAILED: ' + path + ': ' + info)
+                continue
+            connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               (path, info['fileType'], info['channel'], info['scanDirection'],
+                                info['date'].strftime('%Y-%m-%d'), info['numberOfRecords'],
+                                _isoformat(info['firstTime']), _isoformat(info['lastTime']), stat[0], stat[1]))
+            connection.execute('DELETE FROM wavenumbers WHERE path = ?', (path,))
+            connection.executemany('INSERT INTO wavenumbers VALUES (?, ?, ?, ?, ?)',
+                                   [(path, variable) + tuple(wavenumberRange)
+                                    for variable, wavenumberRange in info['wavenumberRanges'].items()])
+            catalogued += 1
+    connection.commit()
+    connection.close()
+
+    if verbose:
+        print('Catalogued {} DMV files in {}; {} unchanged, {} failed.'.format(catalogued, database, unchanged, failed))
+
+    return catalogued
+
+
+def queryCatalog(database, fileType=None, channel=None, scanDirection=None, start=None, end=None):
+    """
+    Returns the rows of the files table of a catalog that match all of the
+    given criteria, ordered by date, as a list of dictionaries. start and
+    end are dates, 'yyyy-mm-dd', and are inclusive.
+
+    Usage:
+        from catalogDMV import queryCatalog
+        days = [f['date'] for f in queryCatalog('paeri.sqlite', 'CXS', '2', start='2011-01-01', end='2013-12-31')]
+    """
+    criteria = []
+    values = []
+    for column, value in (('fileType', fileType), ('channel', channel), ('scanDirection', scanDirection)):
+        if value is not None:
+            criteria.append(column + ' = ?')
+            values.append(value)
+    if start is not None:
+        criteria.append('date >= ?')
+        values.append(str(start)[:10])
+    if end is not None:
+        criteria.append('date <= ?')
+        values.append(str(end)[:10])
+
+    query = 'SELECT * FROM files'
+    if criteria:
+        query += ' WHERE ' + ' AND '.join(criteria)
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    rows = [dict(row) for row in connection.execute(query + ' ORDER BY date, path', values)]
+    connection.close()
+
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build an SQLite catalog of SSEC DMV files.')
+    parser.add_argument('directories', nargs='+', help='directories to search for DMV files')
+    parser.add_argument('-d', '--database', default='dmvcatalog.sqlite', help='SQLite database file')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-t', '--types', nargs='+', default=list(DMVextensions), help='DMV file types to catalog')
+    args = parser.parse_args(argv)
+
+    buildCatalog(args.directories, args.database, args.types, args.workers)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
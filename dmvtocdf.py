@@ -0,0 +1,585 @@
+# -*- coding: utf-8 -*-
+"""
+Batch conversion of SSEC DMV files to netCDF.
+
+Finds the DMV files in one or more directories (for instance whole
+AE-yymmdd directories), converts each one with readDMV in a pool of worker
+processes and writes one netCDF file per DMV file. Failures are reported
+per file and do not stop the rest of the batch.
+
+An optional JSON manifest records the size, modification time and SHA-256
+hash of each converted DMV file, together with its output file and the
+readDMV version that produced it. With a manifest, files that are unchanged
+since their last conversion by the current readDMV are skipped.
+
+From Python:
+    from dmvtocdf import convertDMVdirectory
+    results = convertDMVdirectory('/Users/vonw/data/paeri/raw/AE160602', outputDirectory='nc', workers=8,
+                                  manifest='nc/manifest.json')
+
+From the command line:
+    python dmvtocdf.py /Users/vonw/data/paeri/raw/AE1606* -o nc -j 8 -t RNC SUM -m nc/manifest.json
+
+Successive days of one file type can instead be appended to a single Zarr
+store along time (see convertDMVtoZarr):
+    python dmvtocdf.py /Users/vonw/data/paeri/raw/AE16*/*C1.RNC -z paeri_C1_RNC.zarr
+
+The housekeeping (time series) variables can be exported to a Parquet
+dataset partitioned by file type and date (see writeParquet):
+    python dmvtocdf.py /Users/vonw/data/paeri/raw/AE16* -t RNC SUM -p parquet
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import readDMV as readDMVmodule
+from readDMV import readDMV
+
+DMVextensions = ('RNC', 'RFC', 'RLC', 'CXS', 'CXV', 'SUM')
+
+
+def findDMVfiles(directory, filetypes=DMVextensions):
+    """Returns the sorted paths of all DMV files of the given types below directory."""
+    filetypes = [filetype.upper() for filetype in filetypes]
+    filenames = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.split('.')[-1].upper() in filetypes:
+                filenames.append(os.path.join(root, name))
+
+    return sorted(filenames)
+
+
+def outputFilename(filename, outputDirectory=None):
+    """Returns the netCDF file name for a DMV file, e.g. 160602C1.RNC -> 160602C1_RNC.nc"""
+    if outputDirectory is None:
+        outputDirectory = os.path.dirname(filename)
+
+    return os.path.join(outputDirectory, os.path.basename(filename).replace('.', '_') + '.nc')
+
+
+def convertDMV(filename, output, quantize=False):
+    """
+    Converts a single DMV file to netCDF with writeNetCDF. The file is
+    written under a temporary name and renamed when complete, so that an
+    interrupted conversion never leaves a truncated output file behind.
+
+    Returns a dictionary with the file name, output file name, the time taken
+    in seconds and the error message (None if the conversion succeeded).
+    """
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        ds = readDMV(filename, memmap=True)
+        writeNetCDF(ds, output + '.tmp', quantize=quantize)
+        os.replace(output + '.tmp', output)
+        error = None
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+        if os.path.exists(output + '.tmp'):
+            os.remove(output + '.tmp')
+
+    return {'filename': filename,
+            'output': output,
+            'seconds': time.perf_counter() - start,
+            'error': error}
+
+
+def netCDFencoding(ds, complevel=4, quantize=False, chunkBytes=1 << 20, numberOfRecords=None):
+    """
+    Returns netCDF4 encodings for the numeric variables of a DMV dataset:
+    zlib compression with the shuffle filter, and chunks that hold whole
+    spectra for a block of records of about chunkBytes, so that reading a
+    slice of time only touches a few chunks. The chunks of variables along
+    time hold at most numberOfRecords records (default: the number of records
+    of ds; give more for a file that will grow). If quantize is True, floating
+    point variables with a 'precision' attribute (e.g. '1E-4', carried from
+    the TOC and ohwhio) are rounded to that precision before compression.
+
+    Times are stored as int64 nanoseconds since the start of the day of the
+    first time, rather than in units that xarray infers from the first
+    records; those can be whole days if there is only one record, and would
+    truncate every time that is appended later.
+    """
+    encoding = {}
+    for name, variable in ds.variables.items():
+        if (variable.ndim == 1) and (variable.dtype.kind == 'M') and variable.size:
+            day = np.datetime_as_string(variable.values[0], unit='D')
+            encoding[name] = {'units': 'nanoseconds since ' + day + ' 00:00:00',
+                              'calendar': 'proleptic_gregorian',
+                              'dtype': 'int64'}
+            continue
+        if (variable.ndim == 0) or (variable.dtype.kind not in 'fiu'):
+            continue
+        recordBytes = variable.dtype.itemsize * int(np.prod(variable.shape[1:]))
+        records = variable.shape[0]
+        if (numberOfRecords is not None) and (variable.dims[0] in ('time', 'time_offset')):
+            records = numberOfRecords
+        records = max(1, min(records, chunkBytes // max(recordBytes, 1)))
+        encoding[name] = {'zlib': True,
+                          'complevel': complevel,
+                          'shuffle': True,
+                          'chunksizes': (records,) + variable.shape[1:]}
+        if quantize and (variable.dtype.kind == 'f') and ('precision' in variable.attrs):
+            encoding[name]['least_significant_digit'] = max(0, int(round(-np.log10(float(variable.attrs['precision'])))))
+
+    return encoding
+
+
+def writeNetCDF(ds, output, complevel=4, quantize=False, batch_records=1000):
+    """
+    Writes a DMV dataset (e.g. from readDMV) to a compressed, chunked netCDF4
+    file; see netCDFencoding. The records are written batch_records at a
+    time along the unlimited time dimension, so a memory-mapped or lazy
+    dataset is never loaded into memory all at once.
+
+    Usage:
+        from readDMV import readDMV
+        from dmvtocdf import writeNetCDF
+        writeNetCDF(readDMV('160602C1.RNC', memmap=True), '160602C1_RNC.nc', quantize=True)
+    """
+    encoding = netCDFencoding(ds, complevel, quantize)
+    # time_offset has a dimension of its own; it grows with time as well.
+    unlimitedDimensions = [dim for dim in ds.dims if dim in ('time', 'time_offset')]
+    if not unlimitedDimensions:
+        ds.to_netcdf(output, encoding=encoding)
+        return
+
+    if os.path.exists(output):
+        os.remove(output)
+    numberOfRecords = max(ds.sizes[dim] for dim in unlimitedDimensions)
+    for start in range(0, max(numberOfRecords, 1), batch_records):
+        batch = ds.isel({dim: slice(start, start + batch_records) for dim in unlimitedDimensions})
+        appendNetCDF(output, batch, encoding=encoding)
+
+
+def appendNetCDF(output, ds, dimension='time', encoding=None):
+    """
+    Appends the records of ds along dimension to a netCDF file, creating the
+    file (with dimension unlimited) if it does not exist yet. Variables that
+    do not depend on dimension are only written when the file is created.
+    Used by readDMV.followDMV.
+
+    The file is created compressed and chunked with encoding, by default
+    netCDFencoding with chunks for at least 1024 records, since the first
+    records of a file that is followed are usually only a few.
+    """
+    import netCDF4
+    import xarray as xr
+
+    # time_offset has a dimension of its own; it grows with time as well.
+    unlimitedDimensions = [dim for dim in ds.dims if dim in (dimension, 'time_offset')]
+    if not os.path.exists(output):
+        if (encoding is None):
+            encoding = netCDFencoding(ds, numberOfRecords=max([1024] + [ds.sizes[dim] for dim in unlimitedDimensions]))
+        ds.to_netcdf(output, encoding=encoding, unlimited_dims=unlimitedDimensions)
+        return
+
+    with netCDF4.Dataset(output, 'a') as nc:
+        # Current lengths of the unlimited dimensions, before any variable is extended.
+        lengths = {dim: len(nc.dimensions[dim]) for dim in unlimitedDimensions}
+        for name, variable in ds.variables.items():
+            if (variable.ndim == 0) or (variable.dims[0] not in unlimitedDimensions):
+                continue
+            values = variable.values
+            if (name == dimension) and (values.dtype.kind == 'M'):
+                # Encode the times with the units and calendar already used in the file.
+                values, _, _ = xr.coding.times.encode_cf_datetime(values, nc[name].units,
+                                                                   getattr(nc[name], 'calendar', None),
+                                                                   nc[name].dtype)
+            n = lengths[variable.dims[0]]
+            nc[name][n:n + len(values)] = values
+
+
+def netCDFrecords(output, dimension='time'):
+    """Returns the length of dimension in a netCDF file, or 0 if the file does not exist."""
+    import netCDF4
+
+    if not os.path.exists(output):
+        return 0
+    with netCDF4.Dataset(output) as nc:
+        return len(nc.dimensions[dimension])
+
+
+def zarrEncoding(ds, complevel=4, chunkBytes=1 << 20):
+    """
+    Returns Zarr encodings for the numeric variables of a DMV dataset: blosc
+    (zstd with byte shuffle) compression, and the same record-block chunks as
+    netCDFencoding, so that a slice of time only touches a few chunks.
+    """
+    from numcodecs import Blosc
+
+    encoding = {}
+    for name, variable in ds.variables.items():
+        if (variable.ndim == 0) or (variable.dtype.kind not in 'fiuM'):
+            continue
+        # Chunks are not limited to the records of the first file, as the store grows along time.
+        recordBytes = variable.dtype.itemsize * int(np.prod(variable.shape[1:]))
+        records = max(1, chunkBytes // max(recordBytes, 1))
+        encoding[name] = {'compressors': (Blosc(cname='zstd', clevel=complevel, shuffle=Blosc.SHUFFLE),),
+                          'chunks': (records,) + variable.shape[1:]}
+
+    return encoding
+
+
+def appendZarr(store, ds, dimension='time'):
+    """
+    Appends the records of ds along dimension to a Zarr store, creating the
+    store if it does not exist yet. Records whose times are already in the
+    store are skipped, so appending the same file twice does nothing. Zarr
+    stores only grow at the end, so records at or before the last time in the
+    store that are not already in it (e.g. a day that was skipped) raise a
+    ValueError rather than being lost; write those to a new store.
+
+    The store holds one continuous dataset, so the per-file variables
+    FileHistory, base_time, date and time_offset are not written; time holds the absolute
+    times. The metadata is consolidated after each append, so the whole
+    archive opens with a single read:
+        xr.open_zarr(store)
+    """
+    import xarray as xr
+
+    perFile = [name for name, variable in ds.variables.items()
+               if (name != dimension) and (dimension not in variable.dims) and (name not in ds.coords)]
+    ds = ds.drop_vars(perFile)
+    if ('time_offset' in ds.dims) and (dimension != 'time_offset'):
+        ds = ds.drop_dims('time_offset')
+
+    if not os.path.exists(store):
+        ds.to_zarr(store, mode='w-', encoding=zarrEncoding(ds), consolidated=True, zarr_format=2)
+        return ds.sizes[dimension]
+
+    with xr.open_zarr(store, consolidated=True) as archive:
+        stored = archive[dimension].values
+    if len(stored):
+        times = ds[dimension].values
+        earlier = times <= stored[-1]
+        missing = np.count_nonzero(~np.isin(times[earlier], stored))
+        if missing:
+            raise ValueError('{} records are at or before the last {} of {} ({}) but are not in it; '
+                             'a Zarr store can only be appended to in time order.'.format(
+                                 missing, dimension, store, stored[-1]))
+        ds = ds.isel({dimension: ~earlier})
+    if (ds.sizes[dimension] == 0):
+        return 0
+    # Variables that do not depend on dimension (e.g. wnum1) are already in the store.
+    ds = ds.drop_vars([name for name, variable in ds.variables.items() if dimension not in variable.dims])
+    ds.to_zarr(store, append_dim=dimension, consolidated=True)
+    return ds.sizes[dimension]
+
+
+def convertDMVtoZarr(filenames, store, verbose=True):
+    """
+    Appends successive DMV files of one type (e.g. all of the C1.RNC files of
+    a campaign) to a single Zarr store along time; see appendZarr. The files
+    are read with readDMV in time order, one after the other.
+
+    Usage:
+        import glob
+        from dmvtocdf import convertDMVtoZarr
+        convertDMVtoZarr(glob.glob('/Users/vonw/data/paeri/raw/AE16*/*C1.RNC'), 'paeri_C1_RNC.zarr')
+
+    Output:
+        List of result dictionaries like those of convertDMV, with the number of
+        records appended from each file.
+    """
+    filenames = sorted(filenames, key=os.path.basename)
+    filetypes = set(fileType(filename) for filename in filenames)
+    if (len(filetypes) > 1):
+        raise ValueError('A Zarr store holds one type of DMV file; got ' + ', '.join(sorted(filetypes)))
+
+    results = []
+    for filename in filenames:
+        start = time.perf_counter()
+        try:
+            records = appendZarr(store, readDMV(filename, memmap=True))
+            error = None
+        except Exception as e:
+            records = 0
+            error = '{}: {}'.format(type(e).__name__, e)
+        results.append({'filename': filename,
+                        'output': store,
+                        'records': records,
+                        'seconds': time.perf_counter() - start,
+                        'error': error})
+        if verbose: reportResult(results[-1])
+
+    if verbose: reportSummary(results)
+
+    return results
+
+
+def fileType(filename):
+    """Returns the type of a DMV file from its name, e.g. 'C1.RNC' for 160602C1.RNC, or 'SUM' for 160602.SUM."""
+    return os.path.basename(filename)[6:].lstrip('.').upper()
+
+
+def housekeepingTable(ds, filename, dimension='time'):
+    """
+    Returns the housekeeping variables of a DMV dataset (every variable that
+    is a time series, i.e. that only depends on time) as an Arrow table with
+    one row per record. Columns 'filetype' and 'date' (yyyymmdd) are added
+    for partitioning; see writeParquet.
+    """
+    import pyarrow as pa
+    from readDMV import fileDate
+
+    columns = OrderedDict([(dimension, ds[dimension].values)])
+    for name, variable in ds.variables.items():
+        if (variable.dims == (dimension,)) and (name != dimension):
+            columns[name] = variable.values
+    table = pa.table(columns)
+    attributes = [(name, str(ds[name].attrs.get('units', ''))) for name in columns]
+    table = table.replace_schema_metadata({'units': json.dumps(OrderedDict(attributes))})
+    n = table.num_rows
+    table = table.append_column('filetype', pa.array([fileType(filename)] * n))
+    table = table.append_column('date', pa.array([fileDate(filename).strftime('%Y%m%d')] * n))
+
+    return table
+
+
+def writeParquet(ds, filename, directory):
+    """
+    Writes the housekeeping variables of a DMV dataset (see housekeepingTable)
+    to a Parquet dataset below directory, partitioned by file type and date:
+        directory/filetype=C1.RNC/date=20160602/160602C1_RNC.parquet
+    Writing the same DMV file again replaces its Parquet file. Each file type
+    has its own columns, so open one type at a time, e.g.
+
+    Usage:
+        import pyarrow.dataset as pads
+        hk = pads.dataset('parquet/filetype=C1.RNC', partitioning='hive')
+        table = hk.to_table(columns=['time', 'HBBtopTemp'], filter=pads.field('date') >= 20160601)
+    """
+    import pyarrow.parquet as pq
+
+    stem = os.path.basename(filename).replace('.', '_')
+    pq.write_to_dataset(housekeepingTable(ds, filename), directory, partition_cols=['filetype', 'date'],
+                        basename_template=stem + '-{i}.parquet', existing_data_behavior='delete_matching')
+
+
+def convertDMVtoParquet(filenames, directory, verbose=True):
+    """
+    Exports the housekeeping variables of DMV files to a Parquet dataset
+    partitioned by file type and date; see writeParquet. Only the
+    housekeeping columns of each record are read from the files.
+
+    Output:
+        List of result dictionaries like those of convertDMV.
+    """
+    results = []
+    for filename in filenames:
+        start = time.perf_counter()
+        try:
+            writeParquet(readDMV(filename, memmap=True), filename, directory)
+            error = None
+        except Exception as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+        results.append({'filename': filename,
+                        'output': directory,
+                        'seconds': time.perf_counter() - start,
+                        'error': error})
+        if verbose: reportResult(results[-1])
+
+    if verbose: reportSummary(results)
+
+    return results
+
+
+def _convertDMV(args):
+    filename, output, hashFile, quantize = args
+    # The state of the DMV file is taken before it is read, so a file that changes
+    #   during the conversion is converted again next time.
+    state = fileState(filename) if hashFile else {}
+    result = convertDMV(filename, output, quantize)
+    result.update(state)
+
+    return result
+
+
+def fileHash(filename, blockSize=1 << 20):
+    """Returns the SHA-256 hash of the contents of a file as a hex string."""
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def fileState(filename):
+    """Returns the size, modification time and content hash of a file for the manifest."""
+    stat = os.stat(filename)
+
+    return {'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'sha256': fileHash(filename)}
+
+
+def readManifest(manifest):
+    """Reads a JSON manifest; returns an empty one if the file does not exist yet."""
+    if not os.path.exists(manifest):
+        return {}
+    with open(manifest) as f:
+        return json.load(f)
+
+
+def writeManifest(manifest, entries):
+    """Writes a JSON manifest under a temporary name, then renames it into place."""
+    os.makedirs(os.path.dirname(manifest) or '.', exist_ok=True)
+    with open(manifest + '.tmp', 'w') as f:
+        json.dump(entries, f, indent=1, sort_keys=True)
+    os.replace(manifest + '.tmp', manifest)
+
+
+def isUpToDate(entry, filename, output):
+    """
+    Determines whether a DMV file still matches its manifest entry. The size
+    and modification time are checked first; the contents are only hashed if
+    the modification time changed but the size did not. If the contents are
+    unchanged the entry is updated with the new modification time.
+    """
+    if (entry is None) or (entry['version'] != readDMVmodule.__version__) or (entry['output'] != output):
+        return False
+    if not os.path.exists(output):
+        return False
+    stat = os.stat(filename)
+    if (stat.st_size != entry['size']):
+        return False
+    if (stat.st_mtime_ns != entry['mtime']):
+        if (fileHash(filename) != entry['sha256']):
+            return False
+        entry['mtime'] = stat.st_mtime_ns
+
+    return True
+
+
+def convertDMVfiles(filenames, outputDirectory=None, workers=None, verbose=True, manifest=None, force=False,
+                    quantize=False, manifestInterval=10.0):
+    """
+    Converts a list of DMV files to netCDF using a pool of worker processes.
+
+    Input:
+        filenames       - DMV file names
+        outputDirectory - directory for the netCDF files (default: next to each DMV file)
+        workers         - number of worker processes (default: number of CPUs);
+                          workers=1 converts the files one after the other in this process.
+        verbose         - print the time taken (or the error) for each file and a summary.
+        manifest        - JSON manifest file; files that are unchanged since they were last
+                          converted by this version of readDMV are skipped.
+        force           - convert all files even if the manifest says they are up to date.
+        quantize        - round variables to their precision before compression (lossy).
+        manifestInterval - seconds between updates of the manifest while the files are
+                          converted; it is always written at the end.
+
+    Output:
+        List of result dictionaries from convertDMV for the files that were converted,
+        in the order of filenames (they are printed in the order they finish).
+    """
+    entries = readManifest(manifest) if manifest else {}
+    tasks = []
+    for filename in filenames:
+        output = outputFilename(filename, outputDirectory)
+        if manifest and not force and isUpToDate(entries.get(os.path.abspath(filename)), filename, output):
+            continue
+        tasks.append((filename, output, bool(manifest), quantize))
+    if verbose and manifest:
+        print('Skipping {} of {} DMV files that are up to date in {}'.format(len(filenames) - len(tasks), len(filenames), manifest))
+
+    # The manifest is updated as the results arrive, at most every manifestInterval seconds,
+    #   so that an interrupted run does not convert the finished files again.
+    results = [None] * len(tasks)
+    written = [time.monotonic()]
+
+    def collect(i, result):
+        results[i] = result
+        if verbose: reportResult(result)
+        if manifest and (result['error'] is None):
+            entries[os.path.abspath(result['filename'])] = {'size': result['size'],
+                                                            'mtime': result['mtime'],
+                                                            'sha256': result['sha256'],
+                                                            'output': result['output'],
+                                                            'version': readDMVmodule.__version__}
+            if (time.monotonic() - written[0] >= manifestInterval):
+                writeManifest(manifest, entries)
+                written[0] = time.monotonic()
+
+    if (workers == 1):
+        for i, task in enumerate(tasks):
+            collect(i, _convertDMV(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = dict((pool.submit(_convertDMV, task), i) for i, task in enumerate(tasks))
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+
+    if manifest:
+        writeManifest(manifest, entries)
+
+    if verbose: reportSummary(results)
+
+    return results
+
+
+def convertDMVdirectory(directory, outputDirectory=None, filetypes=DMVextensions, workers=None, verbose=True,
+                        manifest=None, force=False, quantize=False):
+    """Finds the DMV files below directory and converts them to netCDF; see convertDMVfiles."""
+    return convertDMVfiles(findDMVfiles(directory, filetypes), outputDirectory, workers, verbose, manifest, force,
+                           quantize)
+
+
+def reportResult(result):
+    if result['error'] is None:
+        print('{:8.2f} s  {} -> {}'.format(result['seconds'], result['filename'], result['output']))
+    else:
+        print('{:8.2f} s  {} FAILED: {}'.format(result['seconds'], result['filename'], result['error']))
+
+
+def reportSummary(results):
+    failed = [result for result in results if result['error'] is not None]
+    print('Converted {} of {} DMV files in {:.2f} s of processing time; {} failed.'.format(
+        len(results) - len(failed), len(results), sum(result['seconds'] for result in results), len(failed)))
+    for result in failed:
+        print('    ' + result['filename'] + ': ' + result['error'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert SSEC DMV files to netCDF.')
+    parser.add_argument('paths', nargs='+', help='DMV files or directories to search for DMV files')
+    parser.add_argument('-o', '--output', default=None, help='output directory (default: next to each DMV file)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-t', '--types', nargs='+', default=list(DMVextensions), help='DMV file types to convert')
+    parser.add_argument('-m', '--manifest', default=None, help='JSON manifest used to skip files that are up to date')
+    parser.add_argument('-f', '--force', action='store_true', help='convert all files, even if they are up to date')
+    parser.add_argument('-q', '--quantize', action='store_true', help='round variables to their precision before compression (lossy)')
+    parser.add_argument('-z', '--zarr', default=None, help='append all files (of one type) to this Zarr store instead')
+    parser.add_argument('-p', '--parquet', default=None, help='export the housekeeping variables to a Parquet dataset in this directory instead')
+    args = parser.parse_args(argv)
+
+    filenames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filenames.extend(findDMVfiles(path, args.types))
+        else:
+            filenames.append(path)
+
+    if args.zarr:
+        results = convertDMVtoZarr(filenames, args.zarr)
+    elif args.parquet:
+        results = convertDMVtoParquet(filenames, args.parquet)
+    else:
+        results = convertDMVfiles(filenames, args.output, args.workers, manifest=args.manifest, force=args.force,
+                                  quantize=args.quantize)
+
+    return 1 if any(result['error'] is not None for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,11 +5,68 @@ Created on Sat Sep  8 14:36:23 2018
 @author: Von P. Walden, Washington State University
 """
 
+import os
+import numpy as np
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from types import MappingProxyType
+
+# Precompiled format table for one file type: the names of the independent
+#   variables in record order, their offsets (in floats) from the first
+#   independent variable, read-only attribute dicts and the wavenumber scales.
+DMVformat = namedtuple('DMVformat', ['names', 'offsets', 'attributes', 'wavenumberScales'])
+
+
 def getDMVformat(filename):
-    
-    from collections import OrderedDict
+    """
+    Returns the independent variables (with their attributes) and the
+    wavenumber scales for a DMV file as new OrderedDicts that the caller
+    is free to modify. The tables themselves are built only once per file
+    type; see getDMVformatTable.
+    """
+    table = getDMVformatTable(filename)
+    variables = OrderedDict([(name, OrderedDict(table.attributes[name])) for name in table.names])
+    wavenumberScales = OrderedDict(table.wavenumberScales)
+
+    return variables, wavenumberScales
+
+
+def getDMVformatTable(filename):
+    """
+    Returns the immutable, cached DMVformat table for a DMV file. The table
+    is keyed on the file extension, scan direction and channel, so it is
+    only built the first time a file of that type is seen. SUM files
+    (yymmdd.SUM) have no scan direction or channel, so all of them share
+    one table.
+
+    Usage:
+        from ohwhio import getDMVformatTable
+        table = getDMVformatTable('160602C1.RNC')
+        table.names[:5], table.attributes['Time']
+    """
+    name = os.path.basename(filename)
+    stem = name.split('.')[0]
+    extension = name.split('.')[-1].upper()
+    if (extension == 'SUM'):
+        return _DMVformatTable('SUM', '', '')
+
+    return _DMVformatTable(extension, stem[-2:-1], stem[-1:])
+
+
+@lru_cache(maxsize=None)
+def _DMVformatTable(extension, scanDirection, channel):
+    # The channel is part of the cache key only; the tables do not depend on it (yet).
+    variables, wavenumberScales = _buildDMVformat(extension, scanDirection)
+
+    names = tuple(variables)
+    offsets = np.arange(len(names))
+    offsets.setflags(write=False)
+    attributes = MappingProxyType({name: MappingProxyType(dict(variables[name])) for name in names})
+
+    return DMVformat(names, offsets, attributes, MappingProxyType(dict(wavenumberScales)))
+
 
-    extension = filename.split('.')[-1]
+def _buildDMVformat(extension, typ):
 
     if((extension=='RNC') | (extension=='rnc')):
         variables = OrderedDict([
@@ -218,7 +275,6 @@ def getDMVformat(filename):
                      ('outputLaserWavenumber',OrderedDict([('longname','Laser wavenumber used in definition of output wavenumber scale'),('units', 'cm-1'),('precision', '1E-3')])),
                      ('originalInterferogramSize',OrderedDict([('longname','Size of buffer holding initial spectrum'),('units', '32-bit words'),('precision', '1E0')])),
                      ('expandedInterferogramSize',OrderedDict([('longname','Size of buffer holding expanded spectrum before interpolation'),('units', '32-bit words'),('precision', '1E0')]))])
-        typ = filename.split('.')[0][-2:-1]
         wavenumberScales = {'Radiance': 'wnum1'}
     elif((extension=='RLC') | (extension=='rlc')):
         variables = OrderedDict([
@@ -323,7 +379,6 @@ def getDMVformat(filename):
                      ('outputLaserWavenumber',OrderedDict([('longname','Laser wavenumber used in definition of output wavenumber scale'),('units', 'cm-1'),('precision', '1E-3')])),
                      ('originalInterferogramSize',OrderedDict([('longname','Size of buffer holding initial spectrum'),('units', '32-bit words'),('precision', '1E0')])),
                      ('expandedInterferogramSize',OrderedDict([('longname','Size of buffer holding expanded spectrum before interpolation'),('units', '32-bit words'),('precision', '1E0')]))])
-        typ = filename.split('.')[0][-2:-1]
         if (typ == 'B'):
             wavenumberScales = {'atmosphericRadiance': 'wnum1'}
         elif (typ == 'F'):
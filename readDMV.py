@@ -1,4 +1,489 @@
-def readDMV(filename):
+import time
+import bisect
+import struct
+import tracemalloc
+import numpy as np
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+# Version of the reader; files converted by an older version are converted again by dmvtocdf.
+__version__ = '2.1'
+
+# Lightweight description of the header and table of contents (TOC) of a DMV file.
+DMVheader = namedtuple('DMVheader', ['FileHistory',
+                                     'headerSize',
+                                     'ID',
+                                     'sizeTOC',
+                                     'dependentVariables',
+                                     'dependentVariableRecords',
+                                     'dataStart',
+                                     'fileSize'])
+
+# Time and memory taken by one stage of decoding a DMV file; see profileDMV.
+DMVstage = namedtuple('DMVstage', ['filename', 'stage', 'seconds', 'allocated', 'peak'])
+
+# Active profiles, each a (list of DMVstage, callback) pair; see profileDMV.
+_profiles = []
+
+
+def _parseTOC(buf, pos, sizeTOC):
+    """Decodes the table of contents from buf, starting at byte offset pos.
+
+    Returns the dependent variables, their record information and the byte
+    offset just past the table of contents. Raises struct.error if buf ends
+    before the table of contents does.
+    """
+    def readString(pos):
+        nbytes, = struct.unpack_from('<i', buf, pos)
+        if pos + 4 + nbytes > len(buf):
+            raise struct.error('buffer too short for TOC string')
+        return buf[pos + 4:pos + 4 + nbytes].decode('utf-8'), pos + 4 + nbytes
+
+    if (sizeTOC == 40):    # RNC, RFC, RLC, ...
+        tocFormat = '<4i2d2i'
+    elif (sizeTOC == 48):  # CXS, CSV, CVS, UVS, SUM, ...
+        tocFormat = '<4i2d4i'
+    else:
+        raise ValueError('Erroneous size of Table of Contents!! Something is strange with your DMV file!!')
+
+    dependentVariables = OrderedDict({})
+    dependentVariableRecords = OrderedDict({})
+    Continuation = -1  # Non-zero to start loop.
+    while (Continuation):
+        # dependent data information, independent data information and number of attributes for next section.
+        values = struct.unpack_from(tocFormat, buf, pos)
+        pos += sizeTOC
+        if (sizeTOC == 40):
+            # single-variable file.
+            (sizeDependentRecord, formatDependentRecord, scalingFactorLog, dependentPrecisionLog,
+             independentMinimum, independentMaximum, independentPrecisionLog,
+             numberOfDependentAttributes) = values
+            identifier = 1
+            Continuation = 0
+        else:
+            # additional data to support multiple variables.
+            (sizeDependentRecord, formatDependentRecord, scalingFactorLog, dependentPrecisionLog,
+             independentMinimum, independentMaximum, independentPrecisionLog,
+             identifier, Continuation, numberOfDependentAttributes) = values
+        numberOfDependentVariables = identifier + Continuation
+        # Now read the attributes for the variable: name, short name, long name and units.
+        variableName, pos = readString(pos)
+        shortname, pos = readString(pos)
+        longname, pos = readString(pos)
+        units, pos = readString(pos)
+        # Precision
+        precision = "{:.0E}".format(10 ** dependentPrecisionLog)
+        # Now add this to the data variable dictionary.
+        dependentVariables.update({variableName: OrderedDict([('longname', longname),
+                                                              ('units', units),
+                                                              ('precision', precision)])})
+        dependentVariableRecords.update({variableName: OrderedDict([('sizeDependentRecord', sizeDependentRecord),
+                                                                    ('formatDependentRecord', formatDependentRecord),
+                                                                    ('scalingFactorLog', scalingFactorLog),
+                                                                    ('dependentPrecisionLog', dependentPrecisionLog),
+                                                                    ('identifier', identifier),
+                                                                    ('independentMinimum', independentMinimum),
+                                                                    ('independentMaximum', independentMaximum),
+                                                                    ('numberOfDependentAttributes', numberOfDependentAttributes),
+                                                                    ('numberOfDependentVariables', numberOfDependentVariables)])})
+
+    return dependentVariables, dependentVariableRecords, pos
+
+
+def readHeader(filename, blockSize=65536):
+    """
+    Reads only the header and table of contents (TOC) of a DMV file.
+
+    The start of the file is read into a single bytes buffer, which is then
+    decoded with struct offsets; the buffer is only extended if the header
+    and TOC are larger than blockSize. No data records are read, so this is
+    a cheap way to inspect a file.
+
+    Returns a DMVheader with the header text (FileHistory), header size,
+    identifier, TOC size, dependent variables and their record information,
+    the byte offset of the first data record and the file size.
+
+    Usage:
+        from readDMV import readHeader
+        header = readHeader('160602C1.RNC')
+        header.dependentVariables
+    """
+    with open(filename, 'rb') as f:
+        fileSize = f.seek(0, 2)
+        f.seek(0)
+        buf = f.read(blockSize)
+        while True:
+            try:
+                # Header; the first line contains the size of the header in bytes.
+                headerSize = int(buf.split(b'\n', 1)[0].decode('utf-8'))
+                if headerSize + 16 > len(buf):
+                    raise struct.error('buffer too short for header')
+                FileHistory = buf[:headerSize].decode('utf-8')
+                # 12-byte identifier, "SSECRGD     ", followed by the size of the TOC.
+                ID = buf[headerSize:headerSize + 12].decode('utf-8')
+                sizeTOC, = struct.unpack_from('<i', buf, headerSize + 12)
+                dependentVariables, dependentVariableRecords, pos = _parseTOC(buf, headerSize + 16, sizeTOC)
+                # The next 4 bytes give a number of 4-byte words that aren't part of the data records; skip them.
+                nbytes, = struct.unpack_from('<i', buf, pos)
+                dataStart = pos + 4 + 4 * nbytes
+                break
+            except struct.error:
+                if len(buf) >= fileSize:
+                    raise
+                buf += f.read(len(buf))
+
+    return DMVheader(FileHistory, headerSize, ID, sizeTOC, dependentVariables, dependentVariableRecords,
+                     dataStart, fileSize)
+
+
+def DMVfileStructure(filename, header):
+    '''Determines the structure for DMV files.
+
+    Input:
+        filename - DMV file name
+        header   - DMVheader of the file from readHeader
+
+    Output:
+        recordSize - size of data records in bytes for each measurement in time
+        variableOffset - offset (in floats) to where the variables start
+        dataOffset - offset (in float values) to where data starts
+        numberOfRecords - number of complete data records in the file
+        numberOfValues - number of float values in each data record
+        numberOfVariables - number of independent (housekeeping) variables
+        dependentVariables - names of the dependent variables that are decoded
+
+    Notes:
+        Determine number of data records for each time step.
+            factor of 5 is the number of measurements: BB1-BB2-scene-BB2-BB1
+            numberOfDependentVariableBytes is the cumulative number of bytes for all dependent variables
+            factor of 4 is the number of bytes in each number.
+    '''
+    import pandas as pd
+
+    ext    = filename.split('.')[-1]
+    # Work on a copy, so that dropping variables below does not change the header.
+    dependentVariableRecords = OrderedDict(header.dependentVariableRecords)
+
+    # Determine the cumulative number of bytes in the dependent variables.
+    numberOfDependentVariableBytes = np.array([dependentVariableRecords[v]['sizeDependentRecord'] for v in dependentVariableRecords]).sum()
+
+    # Determine the record size, variable offset and data offset based on file type.
+    # ....RNC ######################################################################################################
+    if ((ext == 'RNC') | (ext == 'rnc')):
+        channel = filename.split('.')[0][-1]
+        if channel == '1':
+            nvars = 79
+        else:
+            nvars = 71
+        nvarsExtra1 = 14
+        nvarsExtra2 = 22
+
+        recordSize = ((nvars * 5) + nvarsExtra1 + (nvars * 5) + nvarsExtra2) * 4 + numberOfDependentVariableBytes
+        variableOffset = (nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4)
+        dataOffset = [(nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4) + (nvars + nvarsExtra2)]
+    # ....RFC and RLC ######################################################################################################
+    elif ((ext == 'RLC') | (ext == 'rlc') | (ext == 'RFC') | (ext == 'rfc')):
+        channel = filename.split('.')[0][-1]
+        typ = filename.split('.')[0][-2:-1]
+        if (typ == 'B'):
+            scanDirection = 'Backward'
+        elif(typ == 'F'):
+            scanDirection = 'Forward'
+        else:
+            scanDirection = 'Both'    # C1 or C2
+
+        if ((scanDirection=='Backward') | (scanDirection=='Forward')):    # Backward and Forward
+            if channel == '1':
+                nvars = 79
+            else:
+                nvars = 71
+            nvarsExtra = 14
+
+            recordSize = (nvars * 4)*4 + (nvars + nvarsExtra)*4 + numberOfDependentVariableBytes
+            variableOffset = nvars * 4
+            dataOffset = [(nvars * 5) + nvarsExtra]
+        else:                                                             # Both (C1 or C2)
+            if channel == '1':
+                nvars = 79
+            else:
+                nvars = 71
+            nvarsExtra1 = 14
+            nvarsExtra2 = 15
+
+            recordSize = ((nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4) + (nvars + nvarsExtra2)) * 4 + numberOfDependentVariableBytes
+            variableOffset = (nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4)
+            dataOffset = [(nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4) + (nvars + nvarsExtra2)]
+    # ....CXS ######################################################################################################
+    elif ((ext == 'CXS') | (ext == 'cxs')):
+        nvars = 71
+        nvarsExtra1 = 0
+        nvarsExtra2 = 0
+        channel = filename.split('.')[0][-1]
+        typ = filename.split('.')[0][-2:-1]
+        if (typ == 'B'):
+            scanDirection = 'Backward'
+        else:
+            scanDirection = 'Forward'
+
+        # Special case for Channel 1, Forward direction, which contains 104 extra variables of 28 bytes each.
+        if ((channel == '1') & (scanDirection == 'Forward')):
+            extraBytes = np.array([dependentVariableRecords[v]['sizeDependentRecord'] for v in dependentVariableRecords])[2:].sum()
+            # Now drop all of the extra dependent variables except the real and imag spectra.
+            vs = [variable for variable in dependentVariableRecords]
+            for v in vs[2:]:
+                dependentVariableRecords.pop(v);
+            numberOfDependentVariableBytes = numberOfDependentVariableBytes - extraBytes
+        else:
+            extraBytes = 0
+        # print(numberOfDependentVariableBytes, extraBytes)
+        recordSize = (nvars * 4) + numberOfDependentVariableBytes + extraBytes
+        variableOffset = 0
+        dataOffset = [nvars]
+        for v in dependentVariableRecords:
+            dataOffset.append(dataOffset[-1] + int(dependentVariableRecords[v]['sizeDependentRecord']/4))
+        dataOffset.pop();
+    # ....CXV ######################################################################################################
+    elif ((ext == 'CXV') | (ext == 'cxv')):
+        nvars = 79
+        nvarsExtra1 = 0
+        nvarsExtra2 = 0
+        channel = filename.split('.')[0][-1]
+        typ = filename.split('.')[0][-2:-1]
+        if (typ == 'B'):
+            scanDirection = 'Backward'
+        else:
+            scanDirection = 'Forward'
+
+        # Special case for Channel 1, Forward direction, which contains 104 extra variables of 28 bytes each.
+        if ((channel == '1') & (scanDirection == 'Forward')):
+            extraBytes = np.array([dependentVariableRecords[v]['sizeDependentRecord'] for v in dependentVariableRecords])[2:].sum()
+            # Now drop all of the extra dependent variables except the real and imag spectra.
+            vs = [variable for variable in dependentVariableRecords]
+            for v in vs[2:]:
+                dependentVariableRecords.pop(v);
+            numberOfDependentVariableBytes = numberOfDependentVariableBytes - extraBytes
+        else:
+            extraBytes = 0
+        # print(numberOfDependentVariableBytes, extraBytes)
+        recordSize = (nvars * 4) + numberOfDependentVariableBytes + extraBytes
+        variableOffset = 0
+        dataOffset = [nvars]
+        for v in dependentVariableRecords:
+            dataOffset.append(dataOffset[-1] + int(dependentVariableRecords[v]['sizeDependentRecord']/4))
+        dataOffset.pop();
+    # ....SUM ######################################################################################################
+    elif ((ext == 'SUM') | (ext == 'sum')):
+        # Handles a special case where the format of the SUM files changed
+        #   probably because AERI.xml was changed during ICECAPS.
+        yy = filename.split('.')[-2][-6:-4]
+        if int(yy)>96:
+            yymmdd = '19' + filename.split('.')[-2][-6:]
+        else:
+            yymmdd = '20' + filename.split('.')[-2][-6:]
+        if pd.to_datetime(yymmdd) < pd.to_datetime('20110707'):
+            recordSize = 9776
+        else:
+            recordSize = 9744
+        nvars = 144
+        variableOffset = 1479
+        dataOffset = [variableOffset + nvars]
+        for v in dependentVariableRecords:
+            dataOffset.append(dataOffset[-1] + int(dependentVariableRecords[v]['sizeDependentRecord']/4))
+        dataOffset.pop();
+    else:
+        print('ERROR: Incorrect file type. Try again...')
+        return {}
+
+    # Only complete data records are decoded.
+    numberOfRecords = min(int((header.fileSize - header.headerSize) / recordSize),
+                          (header.fileSize - header.dataStart) // recordSize)
+    numberOfValues = int(recordSize / 4)
+
+    return {'recordSize': recordSize,
+            'variableOffset': variableOffset,
+            'dataOffset': dataOffset,
+            'numberOfRecords': numberOfRecords,
+            'numberOfValues': numberOfValues,
+            'numberOfVariables': nvars,
+            'dependentVariables': list(dependentVariableRecords)
+            }
+
+
+def determineWavenumberScales(ds, filename, header, wavenumberScales):
+    '''Adds the wavenumber scales of the dependent variables to the xarray dataset ds.'''
+    ext = filename.split('.')[-1]
+    dependentVariableRecords = header.dependentVariableRecords
+    vs = [variable for variable in dependentVariableRecords]
+
+    if ((ext == 'RNC') | (ext == 'rnc') | (ext == 'RFC') | (ext == 'rfc') | (ext == 'RLC') | (ext == 'rlc') | (ext == 'CXS') | (ext == 'cxs') | (ext == 'CXV') | (ext == 'cxv')):
+        v = vs[0]
+        bwn = dependentVariableRecords[v]['independentMinimum']
+        ewn = dependentVariableRecords[v]['independentMaximum']
+        nwn = int(dependentVariableRecords[v]['sizeDependentRecord'] / 4)
+        wnum1 = np.linspace(bwn, ewn, nwn, dtype=np.float64)
+
+        # Add the wavenumber scale as a variable to the xarray dataset.
+        ds[wavenumberScales[v]] = wnum1.astype(np.float64)
+        ds[wavenumberScales[v]].attrs['longname'] = 'Wavenumber in reciprocal centimeters'
+        ds[wavenumberScales[v]].attrs['units'] = 'centimeter^-1'
+        ds[wavenumberScales[v]].attrs['precision'] = '1E-4'
+        ds[wavenumberScales[v]].attrs['range_of_values'] = '[ ' + str(bwn) + ', ' + str(ewn) + ' ]'
+    elif((ext == 'SUM') | (ext == 'sum')):
+        for v in ['ResponsivitySpectralAveragesCh1', 'ResponsivitySpectralAveragesCh2', 'SkyVariabilityAveragesCh1', 'SkyVariabilityAveragesCh2', 'SkyRadianceSpectralAveragesCh1', 'SkyRadianceSpectralAveragesCh2']:
+            bwn = dependentVariableRecords[v]['independentMinimum']
+            ewn = dependentVariableRecords[v]['independentMaximum']
+            nwn = int(dependentVariableRecords[v]['sizeDependentRecord'] / 4)
+            wnum1 = np.linspace(bwn, ewn, nwn, dtype=np.float64)
+            # Add the wavenumber scale as a variable to the xarray dataset.
+            ds[wavenumberScales[v]] = wnum1.astype(np.float64)
+            ds[wavenumberScales[v]].attrs['longname'] = 'Wavenumber in reciprocal centimeters'
+            ds[wavenumberScales[v]].attrs['units'] = 'centimeter^-1'
+            ds[wavenumberScales[v]].attrs['precision'] = '1E-4'
+            ds[wavenumberScales[v]].attrs['range_of_values'] = '[ ' + str(bwn) + ', ' + str(ewn) + ' ]'
+    else:
+        print('ERROR: Incorrect file type. Try again...')
+        return {}
+
+    return
+
+
+class DMVRecordArray(object):
+    """
+    Read-only, array-like view of the data records of a DMV file with shape
+    (numberOfRecords, numberOfValues). Indexing memory-maps the file and
+    copies out only the requested records and values, so it can back lazy
+    (e.g. dask) arrays. It only holds the file name and layout, so it is
+    cheap to pickle to other processes.
+    """
+    def __init__(self, filename, dataStart, numberOfRecords, numberOfValues):
+        self.filename = filename
+        self.dataStart = dataStart
+        self.shape = (numberOfRecords, numberOfValues)
+        self.dtype = np.dtype(np.float32)
+        self.ndim = 2
+
+    def __getitem__(self, key):
+        if (self.shape[0] == 0):
+            return np.empty(self.shape, self.dtype)[key]
+        records = np.memmap(self.filename, dtype=self.dtype, mode='r', offset=self.dataStart, shape=self.shape)
+        return np.array(records[key])
+
+    def __dask_tokenize__(self):
+        return (self.filename, self.dataStart, self.shape)
+
+
+class DMVFile(object):
+    """
+    A DMV file whose header, TOC and file structure are parsed once, when the
+    object is created, and reused by every read. Individual records, or any
+    selection of records and variables, can then be decoded without parsing
+    the file again. The object holds no open file or data, only the file
+    name and its layout, so it is cheap to pickle to worker processes.
+
+    Usage:
+        from readDMV import DMVFile
+        f = DMVFile('160602C1.RNC')
+        len(f)                                   # number of records
+        f[10]                                    # Dataset of record 10
+        f[100:200]                               # Dataset of records 100 to 199
+        f.read(records=slice(0, 50), variables=['HBBtemp', 'mean_rad'])
+
+    f.read takes the same optional keywords as readDMV.
+    """
+    def __init__(self, filename):
+        stage = _StageTimer(filename)
+        self.filename = filename
+        self.header = readHeader(filename)
+        stage('header')
+        self.fileStructure = DMVfileStructure(filename, self.header)
+        stage('fileStructure')
+        self.recordArray = DMVRecordArray(filename, self.header.dataStart, self.fileStructure['numberOfRecords'],
+                                          self.fileStructure['numberOfValues'])
+        self._firstTime = None
+
+    def __len__(self):
+        return self.fileStructure['numberOfRecords']
+
+    def __repr__(self):
+        return '<DMVFile {}: {} records>'.format(self.filename, len(self))
+
+    @property
+    def firstTime(self):
+        """Time of the first record of the file, which base_time and time_offset refer to."""
+        if (self._firstTime is None) and len(self):
+            self._firstTime = self.recordArray[0:1, self.fileStructure['variableOffset']][0]
+        return self._firstTime
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.read(records=key)
+        record = range(len(self))[key]
+        return self.read(records=slice(record, record + 1)).isel(time=0)
+
+    def read(self, memmap=False, lazy=False, chunks=None, variables=None, drop_variables=None,
+             records=None, time_range=None, wnum_range=None, complex_spectra=False):
+        """Decodes the file, or a selection of it, into an xarray Dataset; see readDMV."""
+        return self._read(memmap, lazy, chunks, variables, drop_variables, records, time_range, wnum_range,
+                          complex_spectra)
+
+    def _read(self, memmap=False, lazy=False, chunks=None, variables=None, drop_variables=None,
+              records=None, time_range=None, wnum_range=None, complex_spectra=False, wrapRecords=None):
+        """
+        Implements read. wrapRecords, if given, is called with the
+        DMVRecordArray of the selected records and returns the array the
+        variables are sliced from, e.g. the lazily indexed records of the
+        xarray backend (backendDMV.DMVBackendRecords).
+        """
+        lazy = lazy or (chunks is not None)
+        filename, header, fileStructure = self.filename, self.header, self.fileStructure
+        stage = _StageTimer(filename)
+        dropVariables = _dropVariables(filename, fileStructure, variables, drop_variables)
+
+        # Determine the range of records to decode.
+        firstTime = None
+        selection = range(fileStructure['numberOfRecords'])
+        if (records is not None) or (time_range is not None):
+            firstTime = self.firstTime
+            if (records is not None):
+                selection = selection[records]
+                if (selection.step < 1):
+                    raise ValueError('records must be a slice with a positive step.')
+            if (time_range is not None):
+                first, last = findRecords(filename, time_range, self.recordArray, fileStructure['variableOffset'])
+                selection = selection[bisect.bisect_left(selection, first):bisect.bisect_left(selection, last)]
+        if (len(selection) == 0):
+            selection = range(0)
+        dataStart = header.dataStart + selection.start * int(fileStructure['recordSize'])
+        numberOfRecords = selection[-1] - selection.start + 1 if len(selection) else 0
+
+        # View the data as a 2-D array of (numberOfRecords, numberOfValues) so that every
+        #   variable is a single strided slice; no data are copied here. All variables are float32.
+        if (wrapRecords is not None):
+            # Lazily indexed records, e.g. for the xarray backend.
+            records = wrapRecords(DMVRecordArray(filename, dataStart, numberOfRecords, fileStructure['numberOfValues']))
+        elif lazy:
+            # Dask array whose chunks read their range of records from the file when computed.
+            import dask.array as da
+            records = da.from_array(DMVRecordArray(filename, dataStart, numberOfRecords, fileStructure['numberOfValues']),
+                                    chunks=(numberOfRecords if chunks is None else chunks, -1))
+        elif memmap:
+            # Map the data records from the start of the first record rather than reading them;
+            #   pages are only loaded when sliced.
+            records = np.memmap(filename, dtype=np.float32, mode='c', offset=dataStart,
+                                shape=(numberOfRecords, fileStructure['numberOfValues']))
+        else:
+            arr = np.fromfile(filename, np.float32, count=numberOfRecords * fileStructure['numberOfValues'], offset=dataStart)
+            records = arr.reshape(numberOfRecords, fileStructure['numberOfValues'])
+        if (selection.step > 1):
+            records = records[::selection.step]
+        stage('records')
+
+        return _buildDataset(filename, header, fileStructure, records, dropVariables, firstTime, wnum_range,
+                             complex_spectra)
+
+
+def readDMV(filename, memmap=False, lazy=False, chunks=None, variables=None, drop_variables=None,
+            records=None, time_range=None, wnum_range=None, complex_spectra=False):
     """
     Reader for SSEC DMV binary files using "pure Python". This function
     is currently capable of reading RNC, RFC, RLC, and CXS files, but not SUM files.
@@ -30,6 +515,46 @@ def readDMV(filename):
             from readDMV import readDMV
             readDMV('160602.SUM')
 
+    Optional keywords:
+        memmap - If True, the data records are memory-mapped (copy-on-write)
+                 instead of being read into memory all at once. Variables are
+                 then sliced directly out of the page cache, which keeps the
+                 resident memory small for large CXS/CXV files.
+        lazy   - If True, the housekeeping and spectral variables are dask
+                 arrays that read their records from the file only when they
+                 are computed; only the Time variable is read up front.
+                 Requires dask.
+        chunks - Number of records per dask chunk when lazy (default: one
+                 chunk per variable). Giving chunks implies lazy=True.
+        variables - Name or list of names of the only variables to decode,
+                 e.g. ['Time', 'HBBtemp', 'mean_rad']. The time coordinate
+                 and the wavenumber scales of the requested spectra are
+                 always included. Names that are not in the file are ignored.
+        drop_variables - Name or list of names of variables that are not
+                 decoded at all.
+        records - slice of the records to decode, e.g. slice(100, 200).
+        time_range - (start, end) of the records to decode, given either as
+                 datetimes (anything pandas.to_datetime understands) or as
+                 decimal hours of the file's day, like the Time variable.
+                 Hours before the Time of the first record are taken to
+                 be after midnight (hours past 24 also work), so that
+                 (0.0, 0.2) finds the records just after midnight of a
+                 file that started the day before. Both ends are included. The range is found by a binary
+                 search of Time, so only the selected records are read.
+                 base_time and time_offset still refer to the first record
+                 of the file.
+        wnum_range - (minimum, maximum) wavenumber window, or a list of such
+                 microwindows, in cm-1. Only these parts of the spectra
+                 (and of their wavenumber scales) are decoded.
+        complex_spectra - If True, the real and imaginary parts of CXS/CXV
+                 spectra (e.g. Ch1ForwardScanRealPartCounts and
+                 Ch1ForwardScanImagPartCounts) are returned as a single
+                 complex64 variable (Ch1ForwardScanComplexCounts) instead.
+                 The parts are stored one after the other in each record,
+                 so they are copied once, straight into the complex array;
+                 with memmap=True that is the only copy that is made. See
+                 also magnitude and phase.
+
     Written by:
         Von P. Walden
         Washington State University
@@ -41,391 +566,812 @@ def readDMV(filename):
             1) create new functions, 
             2) added support for CXV and SUM files.
          1 August 2021 - Added support for RFC files.
+        18 October 2026- Added memory-mapped mode for the data records and
+                         lazy, dask-backed variables.
+    """
+    return DMVFile(filename).read(memmap, lazy, chunks, variables, drop_variables, records, time_range, wnum_range,
+                                  complex_spectra)
+
+
+def findDMVdays(directory, start_date, end_date, filetype='RNC', channel='1', direction='C'):
+    """
+    Returns the DMV files of one type for each day from start_date to
+    end_date (inclusive) that exist, either in daily AEyymmdd directories
+    below directory (e.g. AE160602/160602C1.RNC) or in directory itself.
+    Days without a file are skipped. SUM files (yymmdd.SUM) have no channel
+    or scan direction.
     """
-    import numpy as np
+    import os
     import pandas as pd
-    import xarray as xr
-    from collections import OrderedDict
-    from ohwhio import getDMVformat
-    
-    # Suppress performance warnings from Pandas, vpw 231112
-    import warnings
-    warnings.filterwarnings('ignore')
-
-    def readTOC(sizeTOC):
-        dependentVariables = OrderedDict({})
-        dependentVariableRecords = OrderedDict({})
-        if (sizeTOC == 40):  # RNC, RFC, RLC, ...
-            # dependent data information for single-variable file.
-            sizeDependentRecord = np.fromfile(f, np.int32, 1)[0]
-            formatDependentRecord = np.fromfile(f, np.int32, 1)[0]
-            scalingFactorLog = np.fromfile(f, np.int32, 1)[0]
-            dependentPrecisionLog = np.fromfile(f, np.int32, 1)[0]
-            # independent data information
-            independentMinimum = np.fromfile(f, np.float64, 1)[0]
-            independentMaximum = np.fromfile(f, np.float64, 1)[0]
-            independentPrecisionLog = np.fromfile(f, np.int32, 1)[0]
-            # number of attributes for next section.
-            numberOfDependentAttributes = np.fromfile(f, np.int32, 1)[0]
-            numberOfDependentVariables = 1
-            # Now read the attributes for the single variable.
-            # Variable name
-            nbytes = np.fromfile(f, np.int32, 1)[0]
-            variableName = f.read(nbytes).decode('utf-8')
-            # Short name
-            nbytes = np.fromfile(f, np.int32, 1)[0]
-            shortname = f.read(nbytes).decode('utf-8')
-            # Short name
-            nbytes = np.fromfile(f, np.int32, 1)[0]
-            longname = f.read(nbytes).decode('utf-8')
-            # Units
-            nbytes = np.fromfile(f, np.int32, 1)[0]
-            units = f.read(nbytes).decode('utf-8')
-            # Precision
-            precision = "{:.0E}".format(10 ** dependentPrecisionLog)
-            # Now add this to the data variable dictionary.
-            dependentVariables.update({variableName: OrderedDict([('longname', longname),
-                                                         ('units', units),
-                                                         ('precision', precision)])})
-            dependentVariableRecords.update({variableName: OrderedDict([('sizeDependentRecord', sizeDependentRecord),
-                                                       ('formatDependentRecord', formatDependentRecord),
-                                                       ('scalingFactorLog', scalingFactorLog),
-                                                       ('dependentPrecisionLog', dependentPrecisionLog),
-                                                       ('identifier', identifier),
-                                                       ('independentMinimum', independentMinimum),
-                                                       ('independentMaximum', independentMaximum),
-                                                       ('numberOfDependentAttributes', numberOfDependentAttributes),
-                                                       ('numberOfDependentVariables', numberOfDependentVariables)])})
-        elif (sizeTOC == 48):  # CXS, CSV, CVS, UVS, SUM, ...
-            Continuation = -1  # Non-zero to start loop.
-            while (Continuation):
-                # dependent data information
-                sizeDependentRecord = np.fromfile(f, np.int32, 1)[0]
-                formatDependentRecord = np.fromfile(f, np.int32, 1)[0]
-                scalingFactorLog = np.fromfile(f, np.int32, 1)[0]
-                dependentPrecisionLog = np.fromfile(f, np.int32, 1)[0]
-                # independent data information
-                independentMinimum = np.fromfile(f, np.float64, 1)[0]
-                independentMaximum = np.fromfile(f, np.float64, 1)[0]
-                independentPrecisionLog = np.fromfile(f, np.int32, 1)[0]
-                # additional data to support multiple variables
-                identifier = np.fromfile(f, np.int32, 1)[0]
-                Continuation = np.fromfile(f, np.int32, 1)[0]
-                # number of attributes for next section.
-                numberOfDependentAttributes = np.fromfile(f, np.int32, 1)[0]
-                numberOfDependentVariables = identifier + Continuation
-                # Now read the attributes for the single variable.
-                # Variable name
-                nbytes = np.fromfile(f, np.int32, 1)[0]
-                variableName = f.read(nbytes).decode('utf-8')
-                # Short name
-                nbytes = np.fromfile(f, np.int32, 1)[0]
-                shortname = f.read(nbytes).decode('utf-8')
-                # Short name
-                nbytes = np.fromfile(f, np.int32, 1)[0]
-                longname = f.read(nbytes).decode('utf-8')
-                # Units
-                nbytes = np.fromfile(f, np.int32, 1)[0]
-                units = f.read(nbytes).decode('utf-8')
-                # Precision
-                precision = "{:.0E}".format(10 ** dependentPrecisionLog)
-                # Now add this to the data variable dictionary.
-                dependentVariables.update({variableName: OrderedDict([('longname', longname),
-                                                             ('units', units),
-                                                             ('precision', precision)])})
-                dependentVariableRecords.update({variableName: OrderedDict([('sizeDependentRecord', sizeDependentRecord),
-                                                           ('formatDependentRecord', formatDependentRecord),
-                                                           ('scalingFactorLog', scalingFactorLog),
-                                                           ('dependentPrecisionLog', dependentPrecisionLog),
-                                                           ('identifier', identifier),
-                                                           ('independentMinimum', independentMinimum),
-                                                           ('independentMaximum', independentMaximum),
-                                                           ('numberOfDependentAttributes', numberOfDependentAttributes),
-                                                           (
-                                                           'numberOfDependentVariables', numberOfDependentVariables)])})
+
+    filenames = []
+    for day in pd.date_range(pd.to_datetime(start_date).normalize(), pd.to_datetime(end_date).normalize()):
+        yymmdd = day.strftime('%y%m%d')
+        if (filetype.upper() == 'SUM'):
+            name = yymmdd + '.SUM'
         else:
-            print('Erroneous size of Table of Contents!! Something is strange with your DMV file!!')
-            return (sizeTOC)
+            name = yymmdd + direction + channel + '.' + filetype.upper()
+        for filename in (os.path.join(directory, 'AE' + yymmdd, name), os.path.join(directory, name)):
+            if os.path.exists(filename):
+                filenames.append(filename)
+                break
 
-        return dependentVariables, dependentVariableRecords
+    return filenames
 
-    def DMVfileStructure(filename):
-        '''Determines the structure for DMV files.
 
-        Input:
-            filename - DMV file name
+def readDMVRange(directory, start_date, end_date, filetype='RNC', channel='1', direction='C', variables=None,
+                 drop_variables=None, wnum_range=None, workers=1):
+    """
+    Reads the DMV files of one type for a range of days into a single xarray
+    Dataset, without concatenating daily Datasets. The record counts of all
+    files are read from their headers first, one array per variable is
+    allocated for the whole period, and each file is then copied straight
+    into its part of those arrays from a memory map. Peak memory is little
+    more than the size of the result.
 
-        Output:
-            recordSize - size of data records in bytes for each measurement in time
-            variableOffset - offset (in floats) to where the variables start
-            dataOffset - offset (in float values) to where data starts
+    Input:
+        directory  - directory with the daily AEyymmdd directories (or the files)
+        start_date - first day, e.g. '2016-06-01'
+        end_date   - last day (inclusive)
+        filetype   - DMV file type (extension), e.g. 'RNC', 'RLC', 'CXS' or 'SUM'
+        channel    - '1' or '2'
+        direction  - 'C', 'B' or 'F', as in the file names (e.g. 160602F1.CXS)
+        variables, drop_variables, wnum_range - select the data as in readDMV
+        workers    - number of threads that fill the arrays
 
-        Notes:
-            Determine number of data records for each time step.
-                factor of 5 is the number of measurements: BB1-BB2-scene-BB2-BB1
-                numberOfDependentVariableBytes is the cumulative number of bytes for all dependent variables
-                factor of 4 is the number of bytes in each number.
-        '''
-        ext    = filename.split('.')[-1]
+    Output:
+        xarray Dataset like that of readDMV for the whole period. FileHistory,
+        base_time and date are those of the first file; time_offset refers
+        to its first record.
 
-        # Determine the cumulative number of bytes in the dependent variables.
-        numberOfDependentVariableBytes = np.array([dependentVariableRecords[v]['sizeDependentRecord'] for v in dependentVariableRecords]).sum()
+    Usage:
+        from readDMV import readDMVRange
+        c1 = readDMVRange('/Users/vonw/data/paeri/raw', '2016-06-01', '2016-08-31', 'RNC', '1',
+                          variables=['mean_rad'])
+    """
+    import xarray as xr
+    from concurrent.futures import ThreadPoolExecutor
 
-        # Determine the record size, variable offset and data offset based on file type.
-        # ....RNC ######################################################################################################
-        if ((ext == 'RNC') | (ext == 'rnc')):
-            channel = filename.split('.')[0][-1]
-            if channel == '1':
-                nvars = 79
-            else:
-                nvars = 71
-            nvarsExtra1 = 14
-            nvarsExtra2 = 22
+    files = [DMVFile(filename) for filename in findDMVdays(directory, start_date, end_date, filetype, channel, direction)]
+    files = [f for f in files if len(f)]
+    if not files:
+        raise ValueError('No {} files with records found in {} between {} and {}'.format(
+            filetype, directory, start_date, end_date))
+    keywords = dict(variables=variables, drop_variables=drop_variables, wnum_range=wnum_range)
 
-            recordSize = ((nvars * 5) + nvarsExtra1 + (nvars * 5) + nvarsExtra2) * 4 + numberOfDependentVariableBytes
-            variableOffset = (nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4)
-            dataOffset = [(nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4) + (nvars + nvarsExtra2)]
-        # ....RFC and RLC ######################################################################################################
-        elif ((ext == 'RLC') | (ext == 'rlc') | (ext == 'RFC') | (ext == 'rfc')):
-            channel = filename.split('.')[0][-1]
-            typ = filename.split('.')[0][-2:-1]
-            if (typ == 'B'):
-                scanDirection = 'Backward'
-            elif(typ == 'F'):
-                scanDirection = 'Forward'
-            else:
-                scanDirection = 'Both'    # C1 or C2
-
-            if ((scanDirection=='Backward') | (scanDirection=='Forward')):    # Backward and Forward
-                if channel == '1':
-                    nvars = 79
-                else:
-                    nvars = 71
-                nvarsExtra = 14
-
-                recordSize = (nvars * 4)*4 + (nvars + nvarsExtra)*4 + numberOfDependentVariableBytes
-                variableOffset = nvars * 4
-                dataOffset = [(nvars * 5) + nvarsExtra]
-            else:                                                             # Both (C1 or C2)
-                if channel == '1':
-                    nvars = 79
-                else:
-                    nvars = 71
-                nvarsExtra1 = 14
-                nvarsExtra2 = 15
-
-                recordSize = ((nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4) + (nvars + nvarsExtra2)) * 4 + numberOfDependentVariableBytes
-                variableOffset = (nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4)
-                dataOffset = [(nvars * 4) + (nvars + nvarsExtra1) + (nvars * 4) + (nvars + nvarsExtra2)]
-        # ....CXS ######################################################################################################
-        elif ((ext == 'CXS') | (ext == 'cxs')):
-            nvars = 71
-            nvarsExtra1 = 0
-            nvarsExtra2 = 0
-            channel = filename.split('.')[0][-1]
-            typ = filename.split('.')[0][-2:-1]
-            if (typ == 'B'):
-                scanDirection = 'Backward'
-            else:
-                scanDirection = 'Forward'
-
-            # Special case for Channel 1, Forward direction, which contains 104 extra variables of 28 bytes each.
-            if ((channel == '1') & (scanDirection == 'Forward')):
-                extraBytes = np.array([dependentVariableRecords[v]['sizeDependentRecord'] for v in dependentVariableRecords])[2:].sum()
-                # Now drop all of the extra dependent variables except the real and imag spectra.
-                vs = [variable for variable in dependentVariables]
-                for v in vs[2:]:
-                    dependentVariables.pop(v);
-                    dependentVariableRecords.pop(v);
-                numberOfDependentVariableBytes = numberOfDependentVariableBytes - extraBytes
-            else:
-                extraBytes = 0
-            # print(numberOfDependentVariableBytes, extraBytes)
-            recordSize = (nvars * 4) + numberOfDependentVariableBytes + extraBytes
-            variableOffset = 0
-            dataOffset = [nvars]
-            for v in dependentVariableRecords:
-                dataOffset.append(dataOffset[-1] + int(dependentVariableRecords[v]['sizeDependentRecord']/4))
-            dataOffset.pop();
-        # ....CXV ######################################################################################################
-        elif ((ext == 'CXV') | (ext == 'cxv')):
-            nvars = 79
-            nvarsExtra1 = 0
-            nvarsExtra2 = 0
-            channel = filename.split('.')[0][-1]
-            typ = filename.split('.')[0][-2:-1]
-            if (typ == 'B'):
-                scanDirection = 'Backward'
-            else:
-                scanDirection = 'Forward'
-
-            # Special case for Channel 1, Forward direction, which contains 104 extra variables of 28 bytes each.
-            if ((channel == '1') & (scanDirection == 'Forward')):
-                extraBytes = np.array([dependentVariableRecords[v]['sizeDependentRecord'] for v in dependentVariableRecords])[2:].sum()
-                # Now drop all of the extra dependent variables except the real and imag spectra.
-                vs = [variable for variable in dependentVariables]
-                for v in vs[2:]:
-                    dependentVariables.pop(v);
-                    dependentVariableRecords.pop(v);
-                numberOfDependentVariableBytes = numberOfDependentVariableBytes - extraBytes
-            else:
-                extraBytes = 0
-            # print(numberOfDependentVariableBytes, extraBytes)
-            recordSize = (nvars * 4) + numberOfDependentVariableBytes + extraBytes
-            variableOffset = 0
-            dataOffset = [nvars]
-            for v in dependentVariableRecords:
-                dataOffset.append(dataOffset[-1] + int(dependentVariableRecords[v]['sizeDependentRecord']/4))
-            dataOffset.pop();
-        # ....SUM ######################################################################################################
-        elif ((ext == 'SUM') | (ext == 'sum')):
-            # Handles a special case where the format of the SUM files changed
-            #   probably because AERI.xml was changed during ICECAPS.
-            yy = filename.split('.')[-2][-6:-4]
-            if int(yy)>96:
-                yymmdd = '19' + filename.split('.')[-2][-6:]
-            else:
-                yymmdd = '20' + filename.split('.')[-2][-6:]
-            if pd.to_datetime(yymmdd) < pd.to_datetime('20110707'):
-                recordSize = 9776
-            else:
-                recordSize = 9744
-            nvars = 144
-            variableOffset = 1479
-            dataOffset = [variableOffset + nvars]
-            for v in dependentVariableRecords:
-                dataOffset.append(dataOffset[-1] + int(dependentVariableRecords[v]['sizeDependentRecord']/4))
-            dataOffset.pop();
+    # The first record of the first file gives the variables, their shapes and attributes.
+    template = files[0].read(records=slice(0, 1), **keywords)
+    starts = np.cumsum([0] + [len(f) for f in files])
+    recordDimensions = ('time', 'time_offset')
+    arrays = OrderedDict()
+    for name, variable in template.variables.items():
+        if (variable.ndim > 0) and (variable.dims[0] in recordDimensions):
+            arrays[name] = np.empty((starts[-1],) + variable.shape[1:], variable.dtype)
+
+    def fill(i):
+        ds = files[i].read(memmap=True, **keywords)
+        for name, array in arrays.items():
+            if (ds[name].shape[1:] != array.shape[1:]):
+                raise ValueError('{} of {} does not match that of {}'.format(name, files[i].filename, files[0].filename))
+            array[starts[i]:starts[i + 1]] = ds[name].values
+
+    if (workers == 1):
+        for i in range(len(files)):
+            fill(i)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fill, range(len(files))))
+
+    # time_offset of every file refers to its own first record; refer them all to the first record of the period.
+    if ('time_offset' in arrays):
+        arrays['time_offset'][:] = (arrays['time'] - arrays['time'][0]) / np.timedelta64(1, 's')
+
+    variables = OrderedDict()
+    for name, variable in template.variables.items():
+        if name in arrays:
+            variable = xr.Variable(variable.dims, arrays[name], variable.attrs)
+        variables[name] = variable
+    ds = xr.Dataset(OrderedDict((name, variable) for name, variable in variables.items() if name not in template.coords),
+                    coords=OrderedDict((name, variables[name]) for name in template.coords))
+    ds.attrs.update(template.attrs)
+
+    return ds
+
+
+def pairFilename(filename, by=None):
+    """
+    Returns the name of the file that pairs with a DMV file: the other channel
+    (by='channel', e.g. 160602C2.RNC for 160602C1.RNC) or the other scan
+    direction (by='direction', e.g. 160602F1.RLC for 160602B1.RLC). By default,
+    B and F files pair by direction and all others by channel.
+    """
+    import os
+
+    directory, name = os.path.split(filename)
+    stem, ext = name.split('.', 1)
+    if (ext.upper() == 'SUM') or (len(stem) < 8):
+        raise ValueError('SUM files have no channel or scan direction to pair: ' + filename)
+    typ, channel = stem[-2], stem[-1]
+    if by is None:
+        by = 'direction' if typ in 'BF' else 'channel'
+    if (by == 'channel'):
+        stem = stem[:-1] + {'1': '2', '2': '1'}[channel]
+    elif (by == 'direction') and (typ in 'BF'):
+        stem = stem[:-2] + {'B': 'F', 'F': 'B'}[typ] + channel
+    else:
+        raise ValueError('Cannot pair {} by {}'.format(filename, by))
+
+    return os.path.join(directory, stem + '.' + ext)
+
+
+def readDMVPair(filename, pair=None, by=None, join='inner', memmap=False, variables=None, drop_variables=None,
+                wnum_range=None):
+    """
+    Reads a pair of DMV files, the two channels (e.g. 160602C1.RNC and
+    160602C2.RNC) or the two scan directions (e.g. 160602B1.RLC and
+    160602F1.RLC), in two threads, and combines them into one Dataset.
+
+    The files are aligned on time (join as in xarray.align). Variables that
+    are identical in both files, like most of the housekeeping, are kept
+    once; variables that differ get the suffix of their file, e.g.
+    mean_radCh1 and mean_radCh2, or atmosphericRadianceBackward and
+    atmosphericRadianceForward. The spectra of channel 2 are on wnum2. The
+    variables are moved into the result rather than merged with xr.merge,
+    so no data are copied unless the alignment has to drop records.
+
+    Input:
+        filename - DMV file name
+        pair     - the other DMV file (default: pairFilename(filename, by))
+        by       - 'channel' or 'direction'; see pairFilename
+        join     - how the times of the two files are aligned: 'inner', 'outer', 'left', ...
+        memmap, variables, drop_variables, wnum_range - as in readDMV
+
+    Output:
+        xarray Dataset; time_offset refers to the first record of filename.
+
+    Usage:
+        from readDMV import readDMVPair
+        rnc = readDMVPair('160602C1.RNC')
+        rnc.mean_radCh1, rnc.mean_radCh2
+    """
+    import xarray as xr
+    from concurrent.futures import ThreadPoolExecutor
+
+    if pair is None:
+        pair = pairFilename(filename, by)
+    names = [filename.split('/')[-1].split('.')[0], pair.split('/')[-1].split('.')[0]]
+    if (names[0][-1] != names[1][-1]):
+        suffixes = ['Ch' + name[-1] for name in names]
+    else:
+        suffixes = [{'B': 'Backward', 'F': 'Forward', 'C': 'Both'}.get(name[-2], name[-2]) for name in names]
+
+    keywords = dict(memmap=memmap, variables=variables, drop_variables=drop_variables, wnum_range=wnum_range)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first, second = pool.map(lambda f: readDMV(f, **keywords), [filename, pair])
+
+    # Channel 2 spectra have their own wavenumber scale, whichever of the files is channel 2.
+    datasets = [first, second]
+    if ('Ch2' in suffixes):
+        channel2 = suffixes.index('Ch2')
+    elif ('wnum1' in first.dims) and ('wnum1' in second.dims) and not first['wnum1'].equals(second['wnum1']):
+        channel2 = 1
+    else:
+        channel2 = None
+    if (channel2 is not None) and ('wnum1' in datasets[channel2].dims):
+        datasets[channel2] = datasets[channel2].rename({'wnum1': 'wnum2'})
+    first, second = datasets
+    # time_offset has a dimension of its own; it is recomputed for the aligned times below.
+    reference = None
+    if ('time_offset' in first.variables) and (first.sizes['time'] > 0):
+        reference = first['time'].values[0] - np.timedelta64(int(round(float(first['time_offset'].values[0]) * 1e9)), 'ns')
+    first, second = [ds.drop_vars('time_offset', errors='ignore') for ds in (first, second)]
+    first, second = xr.align(first, second, join=join, copy=False,
+                             exclude=[dim for dim in set(first.dims) | set(second.dims) if dim != 'time'])
+
+    variables = OrderedDict()
+    for name, variable in first.variables.items():
+        if (name in second.variables) and not variable.equals(second.variables[name]):
+            variables[name + suffixes[0]] = variable
         else:
-            print('ERROR: Incorrect file type. Try again...')
-            return {}
-
-        numberOfRecords = int((eof - headerSize + 1) / recordSize)
-        numberOfValues = int(recordSize / 4)
-
-        return {'recordSize': recordSize,
-                'variableOffset': variableOffset,
-                'dataOffset': dataOffset,
-                'numberOfRecords': numberOfRecords,
-                'numberOfValues': numberOfValues,
-                'numberOfVariables': nvars
-                }
-
-    def determineWavenumberScales(filename):
-        ext = filename.split('.')[-1]
-        vs = [variable for variable in dependentVariableRecords]
-
-        if ((ext == 'RNC') | (ext == 'rnc') | (ext == 'RFC') | (ext == 'rfc') | (ext == 'RLC') | (ext == 'rlc') | (ext == 'CXS') | (ext == 'cxs') | (ext == 'CXV') | (ext == 'cxv')):
-            v = vs[0]
-            bwn = dependentVariableRecords[v]['independentMinimum']
-            ewn = dependentVariableRecords[v]['independentMaximum']
-            nwn = int(dependentVariableRecords[v]['sizeDependentRecord'] / 4)
-            wnum1 = np.linspace(bwn, ewn, nwn, dtype=np.float64)
+            variables[name] = variable
+    for name, variable in second.variables.items():
+        if (name in first.variables):
+            if not variable.equals(first.variables[name]):
+                variables[name + suffixes[1]] = variable
+        else:
+            variables[name] = variable
+    coords = [name for name in variables if (name in first.coords) or (name in second.coords)]
+    ds = xr.Dataset(OrderedDict((name, variable) for name, variable in variables.items() if name not in coords),
+                    coords=OrderedDict((name, variables[name]) for name in coords))
 
-            # Add the wavenumber scale as a variable to the xarray dataset.
-            ds[wavenumberScales[v]] = wnum1.astype(np.float64)
-            ds[wavenumberScales[v]].attrs['longname'] = 'Wavenumber in reciprocal centimeters'
-            ds[wavenumberScales[v]].attrs['units'] = 'centimeter^-1'
-            ds[wavenumberScales[v]].attrs['precision'] = '1E-4'
-            ds[wavenumberScales[v]].attrs['range_of_values'] = '[ ' + str(bwn) + ', ' + str(ewn) + ' ]'
-        elif((ext == 'SUM') | (ext == 'sum')):
-            for v in ['ResponsivitySpectralAveragesCh1', 'ResponsivitySpectralAveragesCh2', 'SkyVariabilityAveragesCh1', 'SkyVariabilityAveragesCh2', 'SkyRadianceSpectralAveragesCh1', 'SkyRadianceSpectralAveragesCh2']:
-                bwn = dependentVariableRecords[v]['independentMinimum']
-                ewn = dependentVariableRecords[v]['independentMaximum']
-                nwn = int(dependentVariableRecords[v]['sizeDependentRecord'] / 4)
-                wnum1 = np.linspace(bwn, ewn, nwn, dtype=np.float64)
-                # Add the wavenumber scale as a variable to the xarray dataset.
-                ds[wavenumberScales[v]] = wnum1.astype(np.float64)
-                ds[wavenumberScales[v]].attrs['longname'] = 'Wavenumber in reciprocal centimeters'
-                ds[wavenumberScales[v]].attrs['units'] = 'centimeter^-1'
-                ds[wavenumberScales[v]].attrs['precision'] = '1E-4'
-                ds[wavenumberScales[v]].attrs['range_of_values'] = '[ ' + str(bwn) + ', ' + str(ewn) + ' ]'
+    if reference is not None:
+        ds['time_offset'] = (ds['time'].values - reference) / np.timedelta64(1, 's')
+        ds['time_offset'].attrs['longname'] = 'Time offset from base_time'
+
+    return ds
+
+
+def wavenumberWindows(wnum, wnum_range=None):
+    """
+    Returns the (start, stop) index ranges of the wavenumber scale wnum that
+    lie within wnum_range, which is either a single (minimum, maximum) window
+    or a list of such microwindows, in cm-1; both ends are included.
+    Overlapping windows are merged. If wnum_range is None, the whole scale
+    is returned as a single window.
+
+    Usage:
+        wavenumberWindows(ds.wnum1.values, [(675, 680), (985, 990)])
+    """
+    if (wnum_range is None):
+        return [(0, len(wnum))]
+    if np.isscalar(wnum_range[0]):
+        wnum_range = [wnum_range]
+
+    # The wavenumber scales are linear and increasing, so each window is found by bisection.
+    windows = []
+    for minimum, maximum in sorted(wnum_range):
+        start = int(np.searchsorted(wnum, minimum, side='left'))
+        stop = int(np.searchsorted(wnum, maximum, side='right'))
+        if (stop <= start):
+            continue
+        if windows and (start <= windows[-1][1]):
+            windows[-1] = (windows[-1][0], max(stop, windows[-1][1]))
         else:
-            print('ERROR: Incorrect file type. Try again...')
-            return {}
+            windows.append((start, stop))
+
+    return windows
+
+
+def magnitude(real, imag=None):
+    """
+    Returns the magnitude of complex spectra, either of a complex variable
+    (e.g. from readDMV(..., complex_spectra=True)) or of separate real and
+    imaginary parts, without combining them first. Works element-wise on
+    numpy, dask and xarray arrays.
+
+    Usage:
+        from readDMV import readDMV, magnitude
+        cxs = readDMV('160602F1.CXS')
+        m = magnitude(cxs.Ch1ForwardScanRealPartCounts, cxs.Ch1ForwardScanImagPartCounts)
+    """
+    if imag is None:
+        return np.abs(real)
+    return np.hypot(real, imag)
+
+
+def phase(real, imag=None):
+    """Returns the phase (radians) of complex spectra, given as for magnitude."""
+    if imag is None:
+        real, imag = real.real, real.imag
+    return np.arctan2(imag, real)
+
+
+@contextmanager
+def profileDMV(callback=None, memory=False):
+    """
+    Context manager that records the time (and, with memory=True, the memory)
+    taken by each stage of every DMV file decoded inside it, by readDMV,
+    DMVFile, iterDMV and the tools built on them. Profiling is off, and
+    costs nothing, outside of profileDMV.
+
+    The stages are
+        header        - reading the header and TOC (readHeader)
+        fileStructure - DMVfileStructure
+        records       - reading (or mapping) the data records
+        format        - the format table of the file type (ohwhio)
+        housekeeping  - Time and the Dataset of the housekeeping variables
+        wavenumbers   - the wavenumber scales and windows
+        spectra       - the dependent variables (spectra)
+        time_offset   - FileHistory, base_time, date and time_offset
+        attributes    - copying the attributes and dropping unwanted variables
+        complexSpectra - combining real and imaginary spectra, if asked for
+    With lazy=True, the stages only build the dask graph; reading happens
+    when the data are computed.
+
+    Input:
+        callback - function called with a DMVstage as each stage ends, e.g.
+                   to log the stages of a production run.
+        memory   - if True, trace memory allocations with tracemalloc, and
+                   record the bytes still allocated at the end of each stage
+                   (allocated) and the peak during it (peak). This slows
+                   decoding down. Without it, both are None.
+
+    Output:
+        List of DMVstage(filename, stage, seconds, allocated, peak) that is
+        filled in as files are decoded; see reportProfile.
+
+    Usage:
+        from readDMV import readDMV, profileDMV, reportProfile
+        with profileDMV(memory=True) as profile:
+            for filename in filenames:
+                readDMV(filename)
+        reportProfile(profile)
+    """
+    profile = []
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    _profiles.append((profile, callback))
+    try:
+        yield profile
+    finally:
+        _profiles.remove((profile, callback))
+        if started:
+            tracemalloc.stop()
+
+
+def reportProfile(profile, verbose=True):
+    """
+    Summarizes a profile from profileDMV by file type and stage, and prints
+    the summary as a table if verbose.
+
+    Output:
+        OrderedDict keyed on (file type, stage), with the number of calls, the
+        total and mean seconds, the share of the time of the file type, and
+        the largest peak memory in bytes (None without memory tracing).
+    """
+    summary = OrderedDict()
+    for timing in profile:
+        key = (timing.filename.split('.')[-1].upper(), timing.stage)
+        entry = summary.setdefault(key, OrderedDict([('calls', 0), ('seconds', 0.0), ('peak', None)]))
+        entry['calls'] += 1
+        entry['seconds'] += timing.seconds
+        if timing.peak is not None:
+            entry['peak'] = max(entry['peak'] or 0, timing.peak)
 
-        return
+    totals = {}
+    for (fileType, stage), entry in summary.items():
+        totals[fileType] = totals.get(fileType, 0.0) + entry['seconds']
+    for (fileType, stage), entry in summary.items():
+        entry['mean'] = entry['seconds'] / entry['calls']
+        entry['share'] = entry['seconds'] / totals[fileType] if totals[fileType] else 0.0
 
-    # Opens the DMV file.
-    f = open(filename, 'rb')
+    if verbose:
+        print('{:<5} {:<15} {:>7} {:>10} {:>10} {:>7} {:>9}'.format('type', 'stage', 'calls', 'seconds', 'mean ms', 'share', 'peak MB'))
+        for (fileType, stage), entry in sorted(summary.items(), key=lambda item: (item[0][0], -item[1]['seconds'])):
+            peak = '' if entry['peak'] is None else '{:.1f}'.format(entry['peak'] / 2**20)
+            print('{:<5} {:<15} {:>7d} {:>10.3f} {:>10.2f} {:>6.1f}% {:>9}'.format(
+                fileType, stage, entry['calls'], entry['seconds'], 1000 * entry['mean'], 100 * entry['share'], peak))
 
-    # Determine the file size by searching for the end-of-file; eof.
-    eof = f.seek(-1, 2)  # go to the file end and record byte value
+    return summary
 
-    # Determine header size, then skip to beginning of data records.
-    f.seek(0)
 
-    # Read the header.
-    headerSize = int(f.readline().decode('utf-8'))
-    f.seek(0)
-    FileHistory = f.read(headerSize).decode('utf-8')
+class _StageTimer(object):
+    """
+    Lap timer for the stages of decoding a file; each call ends a stage and
+    starts the next one. It does nothing unless profileDMV is active.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.active = bool(_profiles)
+        if self.active:
+            self._start()
 
-    # Decode dependent variables that are associated with the data in the particular file.
-    ID = f.read(12).decode('utf-8')
-    # f.seek(12,1)    # Skip the 12-byte identifier, "SSECRGD     ".
-    sizeTOC = np.fromfile(f, np.int32, 1)[0]
-    dependentVariables, dependentVariableRecords = readTOC(sizeTOC)
+    def _start(self):
+        self.memory = None
+        if tracemalloc.is_tracing():
+            self.memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
 
-    # Determine independent variables.
-    variables, wavenumberScales = getDMVformat(filename)
-    variables.update(dependentVariables)    # Append dependent variables to list of variables
+    def __call__(self, stage):
+        if not self.active:
+            return
+        seconds = time.perf_counter() - self.start
+        allocated = peak = None
+        if (self.memory is not None) and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            allocated, peak = current - self.memory, peak - self.memory
+        timing = DMVstage(self.filename, stage, seconds, allocated, peak)
+        for profile, callback in list(_profiles):
+            profile.append(timing)
+            if callback is not None:
+                callback(timing)
+        self._start()
 
-    # Read the next 4 bytes; not sure what these bytes are, but they aren't part of the data records.
-    nbytes = np.fromfile(f, np.int32, 1)[0]
-    np.fromfile(f, np.int32, nbytes)            # Skip these bytes until I figure out what they represent...
 
-    # Read data in as a float32 array; all RNC variables are float32.
-    arr = np.fromfile(f, np.float32)
-    f.close()
+def unwrapTime(Time, firstTime=None):
+    """
+    Returns Time (decimal hours of the file's day) as float64 hours that keep
+    increasing past midnight. Time in a file only increases from the first
+    record, so any Time below firstTime, the Time of the first record of the
+    file, has wrapped back to 0 at midnight and continues at 24, 25, ...
+    instead; this holds for any block of records, so partial reads agree with
+    full reads. Within Time, a drop of more than 12 hours from one record to
+    the next is a further wrap. Time that already runs past 24 is kept.
+    """
+    hours = np.asarray(Time, np.float64)
+    if not len(hours):
+        return hours
+    if (firstTime is None):
+        firstTime = hours[0]
+    hours = np.where(hours < np.float64(firstTime), hours + 24.0, hours)
+    wraps = np.diff(hours, prepend=hours[0]) < -12.0
+    return hours + 24.0 * np.cumsum(wraps)
+
+
+def timeNanoseconds(Time, firstTime=None):
+    """
+    Returns Time (decimal hours of the file's day, see unwrapTime) as int64
+    nanoseconds from the start of the file's day, the representation of the
+    time coordinate of readDMV.
+    """
+    return np.round(unwrapTime(Time, firstTime) * 3.6e12).astype(np.int64)
 
-    # Determine file structure.
-    fileStructure = DMVfileStructure(filename)
+
+def fileDate(filename):
+    """Returns the date of a DMV file, decoded from its name (yymmdd...), as a pandas Timestamp."""
+    import pandas as pd
+
+    name = filename.split('/')[-1]
+    return pd.to_datetime('20' + name[0:2] + '-' + name[2:4] + '-' + name[4:6])
+
+
+def findRecords(filename, time_range, recordArray=None, variableOffset=None):
+    """
+    Finds the records of a DMV file whose Time lies within time_range,
+    (start, end), given as datetimes or as decimal hours of the file's day.
+    Time increases from record to record, so the range is found with a
+    binary search that reads only a few Time values from the file. The
+    search compares integer nanoseconds, exactly like the time coordinate,
+    so values taken from the time of readDMV select their own records.
+    Decimal hours before the Time of the first record are after midnight,
+    as in unwrapTime, unless that would move the start past the end.
+
+    Returns (first, last) such that records first to last - 1 are in range.
+    """
+    import pandas as pd
+
+    if (recordArray is None):
+        header = readHeader(filename)
+        fileStructure = DMVfileStructure(filename, header)
+        recordArray = DMVRecordArray(filename, header.dataStart, fileStructure['numberOfRecords'], fileStructure['numberOfValues'])
+        variableOffset = fileStructure['variableOffset']
+
+    firstTime = recordArray[0:1, variableOffset][0] if recordArray.shape[0] else 0.0
+
+    # Convert the range to integer nanoseconds from the start of the file's day, the
+    #   representation of the time coordinate, so that its own values are found exactly.
+    #   Hours before the Time of the first record are after midnight, as in unwrapTime,
+    #   unless that would put the start of the range after its end.
+    nanoseconds = []
+    wrapped = []
+    for t in time_range:
+        if hasattr(t, 'dims'):
+            t = t.values[()]
+        if isinstance(t, (int, float, np.number)) and not isinstance(t, np.timedelta64):
+            nanoseconds.append(np.int64(np.round(np.float64(t) * 3.6e12)))
+            wrapped.append(timeNanoseconds([t], firstTime)[0])
+        else:
+            nanoseconds.append((pd.to_datetime(t) - fileDate(filename)).value)
+            wrapped.append(nanoseconds[-1])
+    nanoseconds[1] = wrapped[1]
+    if (wrapped[0] <= nanoseconds[1]):
+        nanoseconds[0] = wrapped[0]
+
+    # Sequence of the Time values, in nanoseconds as in the time coordinate, that reads
+    #   each value from the file only when it is needed.
+    class Time(object):
+        def __len__(self):
+            return recordArray.shape[0]
+
+        def __getitem__(self, record):
+            return timeNanoseconds(recordArray[record:record + 1, variableOffset], firstTime)[0]
+
+    first = bisect.bisect_left(Time(), nanoseconds[0])
+    last = bisect.bisect_right(Time(), nanoseconds[1])
+
+    return first, last
+
+
+def inspectDMV(filename):
+    """
+    Describes a DMV file from its header, TOC and size alone; only the Time
+    of the first and the last record is read from the data records.
+
+    Output:
+        OrderedDict with
+        filename           - DMV file name
+        fileType           - extension, e.g. 'RNC' or 'CXS'
+        channel            - '1' or '2' (None for SUM files)
+        scanDirection      - 'Backward', 'Forward' or 'Both' (None for SUM files)
+        date               - date of the file, from its name
+        numberOfRecords    - number of complete data records
+        wavenumberRanges   - OrderedDict of (minimum, maximum, number of values) for each dependent variable
+        firstTime          - time of the first record (None if there are no records)
+        lastTime           - time of the last record (None if there are no records)
+        fileSize           - size of the file in bytes
+
+    Usage:
+        from readDMV import inspectDMV
+        inspectDMV('160602C1.RNC')['lastTime']
+    """
+    import pandas as pd
+
+    header = readHeader(filename)
+    fileStructure = DMVfileStructure(filename, header)
+    fileType = filename.split('.')[-1].upper()
+    stem = filename.split('/')[-1].split('.')[0]
+    if (fileType == 'SUM'):
+        channel = None
+        scanDirection = None
+    else:
+        channel = stem[-1:]
+        scanDirection = {'B': 'Backward', 'F': 'Forward'}.get(stem[-2:-1], 'Both')
+
+    wavenumberRanges = OrderedDict()
+    for v in fileStructure['dependentVariables']:
+        record = header.dependentVariableRecords[v]
+        wavenumberRanges[v] = (record['independentMinimum'], record['independentMaximum'],
+                               int(record['sizeDependentRecord'] / 4))
+
+    numberOfRecords = fileStructure['numberOfRecords']
+    firstTime = lastTime = None
+    if numberOfRecords:
+        recordArray = DMVRecordArray(filename, header.dataStart, numberOfRecords, fileStructure['numberOfValues'])
+        offset = fileStructure['variableOffset']
+        date = fileDate(filename)
+        first = recordArray[0:1, offset][0]
+        # In integer nanoseconds, exactly as the time coordinate of readDMV.
+        firstTime = date + pd.Timedelta(int(timeNanoseconds([first])[0]), unit='ns')
+        last = timeNanoseconds(recordArray[numberOfRecords - 1:numberOfRecords, offset], first)[0]
+        lastTime = date + pd.Timedelta(int(last), unit='ns')
+
+    return OrderedDict([('filename', filename),
+                        ('fileType', fileType),
+                        ('channel', channel),
+                        ('scanDirection', scanDirection),
+                        ('date', fileDate(filename)),
+                        ('numberOfRecords', numberOfRecords),
+                        ('wavenumberRanges', wavenumberRanges),
+                        ('firstTime', firstTime),
+                        ('lastTime', lastTime),
+                        ('fileSize', header.fileSize)])
+
+
+def iterDMV(filename, batch_records=1000, variables=None, drop_variables=None, wnum_range=None):
+    """
+    Generator that decodes a DMV file in batches of batch_records records,
+    yielding one xarray Dataset per batch. Only one batch of records is in
+    memory at a time, so arbitrarily large files can be processed.
+
+    base_time and time_offset of every batch refer to the first record of
+    the file, so the batches can be concatenated along time. variables,
+    drop_variables and wnum_range select the data as in readDMV.
+
+    Usage:
+        from readDMV import iterDMV
+        for batch in iterDMV('160602C1.RNC', batch_records=500):
+            print(batch.mean_rad.mean().values)
+    """
+    f = DMVFile(filename)
+    dropVariables = _dropVariables(filename, f.fileStructure, variables, drop_variables)
+
+    for start in range(0, len(f), batch_records):
+        records = f.recordArray[start:start + batch_records]
+        yield _buildDataset(filename, f.header, f.fileStructure, records, dropVariables, f.firstTime, wnum_range)
+
+
+def followDMV(filename, interval=600, output=None, start=0, polls=None):
+    """
+    Follows a DMV file that is still being written (e.g. RNC and SUM files
+    during the day) and decodes only the complete records that were appended
+    since the previous poll. The header, TOC and file structure are read once;
+    each poll only checks the size of the file.
+
+    Input:
+        filename - DMV file name
+        interval - seconds to wait between polls
+        output   - netCDF file to which the new records are appended (see
+                   dmvtocdf.appendNetCDF); decoding resumes after the records
+                   that are already in this file.
+        start    - number of records that were already decoded, e.g. the length
+                   of the time dimension of an existing Dataset.
+        polls    - number of polls before stopping (default: follow forever).
+
+    Output:
+        Generator yielding an xarray Dataset of the new records whenever there
+        are any; base_time and time_offset refer to the first record of the file.
+
+    Usage:
+        from readDMV import readDMV, followDMV
+        c1 = readDMV('160602C1.RNC')
+        for new in followDMV('160602C1.RNC', start=c1.sizes['time']):
+            c1 = xr.concat([c1, new], dim='time', data_vars='minimal')
+    """
+    import os
+    import time
+    from dmvtocdf import appendNetCDF, netCDFrecords
+
+    if (output is not None):
+        start = netCDFrecords(output)
+
+    header = None
+    poll = 0
+    while (polls is None) or (poll < polls):
+        if poll:
+            time.sleep(interval)
+        poll += 1
+
+        if (header is None):
+            # Wait for the header and TOC to be written completely.
+            try:
+                header = readHeader(filename)
+            except (struct.error, ValueError):
+                continue
+            fileStructure = DMVfileStructure(filename, header)
+            firstTime = None
+
+        # Number of complete records in the file now.
+        numberOfRecords = max(0, (os.path.getsize(filename) - header.dataStart) // fileStructure['recordSize'])
+        if (numberOfRecords <= start):
+            continue
+        recordArray = DMVRecordArray(filename, header.dataStart, numberOfRecords, fileStructure['numberOfValues'])
+        if (firstTime is None):
+            firstTime = recordArray[0:1, fileStructure['variableOffset']][0]
+
+        ds = _buildDataset(filename, header, fileStructure, recordArray[start:numberOfRecords], firstTime=firstTime)
+        if (output is not None):
+            appendNetCDF(output, ds)
+        start = numberOfRecords
+        yield ds
+
+
+def _dropVariables(filename, fileStructure, variables=None, drop_variables=None):
+    """
+    Returns the set of names of the variables that are not decoded, given
+    either the variables that are wanted or those that are not (or both).
+    """
+    from ohwhio import getDMVformatTable
+
+    if isinstance(variables, str): variables = [variables]
+    if isinstance(drop_variables, str): drop_variables = [drop_variables]
+    dropVariables = set(drop_variables or [])
+    if (variables is not None):
+        formatTable = getDMVformatTable(filename)
+        # Wavenumber scales of the requested spectra are kept as their coordinates.
+        wavenumbers = [formatTable.wavenumberScales[variable] for variable in variables
+                       if variable in fileStructure['dependentVariables']]
+        allVariables = (list(formatTable.names[:fileStructure['numberOfVariables']]) + fileStructure['dependentVariables']
+                        + list(formatTable.wavenumberScales.values()) + ['FileHistory', 'base_time', 'date', 'time_offset'])
+        dropVariables.update([variable for variable in allVariables
+                              if (variable not in variables) and (variable not in wavenumbers)])
+
+    return dropVariables
+
+
+def _buildDataset(filename, header, fileStructure, records, dropVariables=(), firstTime=None, wnum_range=None,
+                  complexSpectra=False):
+    """
+    Creates the xarray dataset from records, a 2-D array-like of the data
+    records (numberOfRecords, numberOfValues) of a DMV file. Columns are
+    taken from records by slicing, so the variables are views of records
+    (or lazy arrays if records is lazy). firstTime is the Time of the
+    first record of the file; it defaults to the Time of the first of
+    records and sets base_time and time_offset. wnum_range selects
+    wavenumber windows of the spectra; see wavenumberWindows. If
+    complexSpectra is True, real and imaginary spectra are combined; see
+    complexSpectra.
+    """
+    import pandas as pd
+    import xarray as xr
+    from ohwhio import getDMVformatTable
+
+    stage = _StageTimer(filename)
+    FileHistory = header.FileHistory
+    dependentVariables = header.dependentVariables
+
+    # Determine independent variables from the cached format table.
+    formatTable = getDMVformatTable(filename)
+    wavenumberScales = formatTable.wavenumberScales
+    stage('format')
 
     # Decode the base_time from the filename.
-    base_time = pd.to_datetime('20' + filename.split('/')[-1][0:2] + '-' + filename.split('/')[-1][2:4] + '-' + filename.split('/')[-1][4:6])
-    Time = arr[fileStructure['variableOffset']::fileStructure['numberOfValues']]
-
-    # Create a Pandas dataframe for all independent variables.
-    df = pd.DataFrame({}, index=base_time + pd.to_timedelta(Time, unit='h'))
-    df.index.name = 'time'
-    for offset, variable in enumerate(variables):
-        if (offset >= fileStructure['numberOfVariables']): break
-        df[variable] = arr[fileStructure['variableOffset'] + offset::fileStructure['numberOfValues']]
-
-    # Creates an xarray dataset from the Pandas dataframe.
-    ds = xr.Dataset().from_dataframe(df)
+    base_time = fileDate(filename)
+    Time = np.asarray(records[:, fileStructure['variableOffset']])
+    if firstTime is None:
+        firstTime = Time[0]
+
+    # Times in integer nanoseconds from the start of the file's day, computed in float64
+    #   from the float32 Time; Time that wraps back to 0 at midnight continues past 24 h.
+    nanoseconds = timeNanoseconds(Time, firstTime)
+    firstNanoseconds = timeNanoseconds([firstTime])[0]
+    time = base_time.to_datetime64().astype('datetime64[ns]') + nanoseconds.astype('timedelta64[ns]')
+
+    # Create the xarray dataset directly from the columns of the records for all independent variables.
+    names = formatTable.names[:fileStructure['numberOfVariables']]
+    offsets = fileStructure['variableOffset'] + formatTable.offsets[:len(names)]
+    independentVariables = OrderedDict({})
+    for variable, offset in zip(names, offsets):
+        if variable in dropVariables: continue
+        independentVariables[variable] = ('time', records[:, offset])
+    ds = xr.Dataset(independentVariables, coords={'time': time})
+    stage('housekeeping')
     # Determines the wavenumbers scales and adds them to the xarray dataset.
-    determineWavenumberScales(filename)
-
-    # Add data for dependent variables.
-    for variable, offset in zip(dependentVariables, fileStructure['dataOffset']):
-        ds[variable] = xr.DataArray(np.array(
-            [arr[int((record * fileStructure['recordSize'] / 4) + offset):int((record * fileStructure['recordSize'] / 4) + offset + len(ds[wavenumberScales[variable]]))] for record in range(fileStructure['numberOfRecords'])]),
-                                    coords=[df.index, ds[wavenumberScales[variable]].data],
-                                    dims=['time', wavenumberScales[variable]])
+    determineWavenumberScales(ds, filename, header, wavenumberScales)
+
+    # Determines the index windows of each wavenumber scale that are decoded, then
+    #   reduces the wavenumber scales to those windows.
+    windows = OrderedDict({})
+    for scale in [scale for scale in OrderedDict.fromkeys(wavenumberScales.values()) if scale in ds.dims]:
+        windows[scale] = wavenumberWindows(ds[scale].values, wnum_range)
+        if (wnum_range is not None):
+            ds = ds.isel({scale: np.concatenate([np.arange(start, stop) for start, stop in windows[scale]] + [np.arange(0)])})
+    stage('wavenumbers')
+
+    # Add data for dependent variables; each window is a strided view of the records.
+    for variable, offset in zip(fileStructure['dependentVariables'], fileStructure['dataOffset']):
+        if variable in dropVariables: continue
+        scale = wavenumberScales[variable]
+        blocks = [records[:, offset + start:offset + stop] for start, stop in windows[scale]]
+        if (len(blocks) == 1):
+            data = blocks[0]
+        elif (len(blocks) == 0):
+            data = np.empty((len(time), 0), np.float32)
+        elif hasattr(blocks[0], 'dask'):
+            import dask.array as da
+            data = da.concatenate(blocks, axis=1)
+        else:
+            data = np.concatenate([np.asarray(block) for block in blocks], axis=1)
+        # Added on the dimensions of ds, so that the wavenumber scale keeps its attributes.
+        ds[variable] = (('time', scale), data)
+    stage('spectra')
     # Global attributes
     ds['FileHistory'] = FileHistory
     # base_time
-    ds['base_time'] = np.int32(
-        (base_time - pd.to_datetime('1970-01-01') + pd.Timedelta(Time[0], unit='h')).total_seconds())
+    firstRecord = base_time + pd.Timedelta(int(firstNanoseconds), unit='ns')
+    ds['base_time'] = np.int32((firstRecord - pd.Timestamp('1970-01-01')).total_seconds())
     ds['base_time'].attrs['longname'] = 'Base time in Epoch'
-    ds['base_time'].attrs['date'] = df.index[0].strftime('%Y-%m-%d,%H:%M:%S GMT')
+    ds['base_time'].attrs['date'] = firstRecord.strftime('%Y-%m-%d,%H:%M:%S GMT')
     # date
     ds['date'] = np.int32(filename.split('/')[-1][0:6])
     # time_offset
-    ds['time_offset'] = np.array(
-        [(pd.Timedelta(time, unit='h') - pd.Timedelta(Time[0], unit='h')).total_seconds() for time in Time])
+    ds['time_offset'] = (nanoseconds - firstNanoseconds) / 1e9
     ds['time_offset'].attrs['longname'] = 'Time offset from base_time'
+    stage('time_offset')
 
     # Adds attributes for each independent variable.
-    for offset, variable in enumerate(variables):
-        if (offset >= fileStructure['numberOfVariables']): break
-        for attribute in variables[variable]:
-            ds[variable].attrs[attribute] = variables[variable][attribute]
+    for variable in independentVariables:
+        ds[variable].attrs.update(formatTable.attributes[variable])
 
     # Adds attributes for each dependent variable.
-    for variable in dependentVariables:
-        for attribute in variables[variable]:
-            ds[variable].attrs[attribute] = variables[variable][attribute]
+    for variable in fileStructure['dependentVariables']:
+        if variable in dropVariables: continue
+        ds[variable].attrs.update(dependentVariables[variable])
+
+    # Drops anything else that was not wanted, e.g. wavenumber scales or time_offset.
+    ds = ds.drop_vars([variable for variable in dropVariables if variable in ds.variables])
+    stage('attributes')
+
+    if complexSpectra:
+        ds = _complexSpectra(ds)
+        stage('complexSpectra')
+
+    return ds
+
+
+def _complexSpectra(ds):
+    """
+    Replaces each pair of real and imaginary spectra in ds (e.g.
+    RealPartCounts and ImagPartCounts) by a single complex64 variable
+    (ComplexCounts). The two parts are copied directly into the complex
+    array, or combined lazily if they are dask arrays.
+    """
+    for real in [variable for variable in ds.data_vars if 'RealPart' in variable]:
+        imag = real.replace('RealPart', 'ImagPart')
+        if imag not in ds.data_vars:
+            continue
+        re, im = ds[real].data, ds[imag].data
+        if hasattr(re, 'dask'):
+            data = (re + 1j * im).astype(np.complex64)
+        else:
+            data = np.empty(re.shape, np.complex64)
+            data.real = re
+            data.imag = im
+        attributes = OrderedDict(ds[real].attrs)
+        attributes['longname'] = 'Complex spectrum: ' + attributes.get('longname', real)
+        name = real.replace('RealPart', 'Complex')
+        ds[name] = (ds[real].dims, data, attributes)
+        ds = ds.drop_vars([real, imag])
 
     return ds
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of readDMV and the tools built on it, run on synthetic DMV files
+written by writeDMV, so that no AERI data are needed:
+    python -m pytest -q test_readDMV.py
+
+testDMV.py, next to this file, plots real files for a visual check instead.
+"""
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ohwhio import getDMVformatTable
+from readDMV import (readDMV, readHeader, DMVfileStructure, DMVFile, iterDMV, inspectDMV, followDMV,
+                     fileDate)
+from writeDMV import DMVtypes, writeDMV, writeDMVfiles, dependentVariables
+
+numberOfRecords = 20
+numberOfWavenumbers = 64
+
+
+def setRecords(filename, columns, values):
+    """Overwrites columns (a column or slice of the values of each record) of every record of a DMV file."""
+    header = readHeader(filename)
+    fileStructure = DMVfileStructure(filename, header)
+    records = np.memmap(filename, np.float32, 'r+', offset=header.dataStart,
+                        shape=(fileStructure['numberOfRecords'], fileStructure['numberOfValues']))
+    records[:, columns] = values
+    records.flush()
+    del records
+
+
+def setTime(filename, Time):
+    """Overwrites the Time of every record of a DMV file."""
+    setRecords(filename, DMVfileStructure(filename, readHeader(filename))['variableOffset'], Time)
+
+
+@pytest.fixture
+def rnc(tmp_path):
+    filename = str(tmp_path / '160602C1.RNC')
+    writeDMV(filename, numberOfRecords, numberOfWavenumbers)
+    return filename
+
+
+@pytest.fixture
+def days(tmp_path):
+    """Three consecutive C1.RNC files of 20, 21 and 22 records."""
+    filenames = []
+    for i, date in enumerate(('160602', '160603', '160604')):
+        filenames.append(str(tmp_path / (date + 'C1.RNC')))
+        writeDMV(filenames[-1], numberOfRecords + i, numberOfWavenumbers, seed=i)
+    return filenames
+
+
+# Decoding
+
+@pytest.mark.parametrize('filetype', DMVtypes)
+def test_decode(tmp_path, filetype):
+    filename = str(tmp_path / ('160602' + filetype))
+    records = writeDMV(filename, numberOfRecords, numberOfWavenumbers)
+    fileStructure = DMVfileStructure(filename, readHeader(filename))
+    ds = readDMV(filename)
+
+    # Housekeeping variables are the columns of the format table.
+    formatTable = getDMVformatTable(filename)
+    names = formatTable.names[:fileStructure['numberOfVariables']]
+    for name, offset in zip(names, fileStructure['variableOffset'] + formatTable.offsets[:len(names)]):
+        np.testing.assert_array_equal(ds[name].values, records[:, offset])
+
+    # Spectra follow each other, in the order of the TOC, from the first data offset;
+    #   the extra variables of channel 1, forward CXS and CXV files are not decoded.
+    offset = fileStructure['dataOffset'][0]
+    for variable, (nwn, bwn, ewn, units) in dependentVariables(filename, numberOfWavenumbers).items():
+        if variable.startswith('ExtraVariable'):
+            assert variable not in ds
+        else:
+            np.testing.assert_array_equal(ds[variable].values, records[:, offset:offset + nwn])
+            scale = ds[variable].dims[1]
+            np.testing.assert_allclose(ds[scale].values[[0, -1]], (bwn, ewn))
+        offset += nwn
+
+    # time is the date of the file plus Time, in decimal hours.
+    Time = records[:, fileStructure['variableOffset']].astype(np.float64)
+    expected = fileDate(filename) + pd.to_timedelta(Time * 3600.0, unit='s')
+    assert np.abs(ds.time.values - expected.values).max() < np.timedelta64(1, 'us')
+    np.testing.assert_allclose(ds.time_offset.values, (Time - Time[0]) * 3600.0, atol=1e-6)
+    assert ds.base_time.values == int((fileDate(filename) + pd.to_timedelta(Time[0], unit='h')
+                                       - pd.Timestamp('1970-01-01')).total_seconds())
+
+    # Every read mode decodes the same dataset.
+    assert readDMV(filename, memmap=True).identical(ds)
+    pytest.importorskip('dask')
+    assert readDMV(filename, lazy=True).load().identical(ds)
+
+
+def test_format_table_cache():
+    # One table per file type, whatever the date or directory of the file.
+    table = getDMVformatTable('160601.SUM')
+    for day in range(2, 31):
+        assert getDMVformatTable('/data/paeri.raw/AE1606{:02d}/1606{:02d}.SUM'.format(day, day)) is table
+    assert getDMVformatTable('/data/paeri.raw/170101C1.RNC') is getDMVformatTable('160602C1.RNC')
+    assert getDMVformatTable('160602B1.RLC') is not getDMVformatTable('160602F1.RLC')
+
+
+@pytest.mark.parametrize('filetype', ['F1.CXS', 'B2.CXV'])
+@pytest.mark.parametrize('mode', ['eager', 'memmap', 'lazy'])
+def test_complex_spectra(tmp_path, filetype, mode):
+    from readDMV import magnitude, phase
+    from benchDMV import readModes
+
+    if (mode == 'lazy'):
+        pytest.importorskip('dask')
+    filename = str(tmp_path / ('160602' + filetype))
+    writeDMV(filename, numberOfRecords, numberOfWavenumbers)
+    parts = readDMV(filename)
+    ds = readDMV(filename, complex_spectra=True, **readModes[mode])
+
+    reals = [name for name in parts.data_vars if 'RealPart' in name]
+    assert reals
+    for real in reals:
+        imag = real.replace('RealPart', 'ImagPart')
+        spectrum = ds[real.replace('RealPart', 'Complex')].load()
+        assert (real not in ds) and (imag not in ds) and (spectrum.dtype == np.complex64)
+        np.testing.assert_array_equal(spectrum.values.real, parts[real].values)
+        np.testing.assert_array_equal(spectrum.values.imag, parts[imag].values)
+        # magnitude and phase agree for complex spectra and for separate parts.
+        np.testing.assert_allclose(magnitude(spectrum).values, magnitude(parts[real], parts[imag]).values, rtol=1e-6)
+        np.testing.assert_allclose(magnitude(parts[real], parts[imag]).values,
+                                   np.hypot(parts[real].values, parts[imag].values))
+        np.testing.assert_allclose(phase(spectrum).values, phase(parts[real], parts[imag]).values, atol=1e-6)
+        np.testing.assert_allclose(phase(parts[real], parts[imag]).values,
+                                   np.arctan2(parts[imag].values, parts[real].values))
+
+
+def test_profileDMV(tmp_path, rnc):
+    import tracemalloc
+    from readDMV import profileDMV, reportProfile
+
+    cxs = str(tmp_path / '160602B1.CXS')
+    writeDMV(cxs, numberOfRecords, numberOfWavenumbers)
+    stages = ['header', 'fileStructure', 'records', 'format', 'housekeeping', 'wavenumbers', 'spectra',
+              'time_offset', 'attributes']
+    called = []
+    with profileDMV(callback=called.append, memory=True) as profile:
+        ds = readDMV(rnc)
+        readDMV(cxs, complex_spectra=True)
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+    # Profiling does not change the data, and stops at the end of the block.
+    assert ds.identical(readDMV(rnc))
+    assert called == profile
+    assert [timing.stage for timing in profile if timing.filename == rnc] == stages
+    assert [timing.stage for timing in profile if timing.filename == cxs] == stages + ['complexSpectra']
+    assert all((timing.seconds >= 0) and (timing.peak >= timing.allocated >= 0) for timing in profile)
+
+    summary = reportProfile(profile, verbose=False)
+    assert summary[('RNC', 'spectra')]['calls'] == 1
+    assert summary[('CXS', 'complexSpectra')]['calls'] == 1
+    assert sum(entry['seconds'] for key, entry in summary.items()) == pytest.approx(
+        sum(timing.seconds for timing in profile))
+
+    # Without memory tracing, only the times are recorded.
+    with profileDMV() as profile:
+        readDMV(rnc)
+    assert profile and all((timing.allocated is None) and (timing.peak is None) for timing in profile)
+
+
+# Selections
+
+def test_records(rnc):
+    full = readDMV(rnc)
+    for records in (slice(3, 15), slice(3, 15, 2), slice(-1, None), slice(5, 5)):
+        ds = readDMV(rnc, records=records)
+        assert ds.identical(full.isel(time=records, time_offset=records))
+    ds = DMVFile(rnc)[4]
+    assert ds.time.values == full.time.values[4]
+    np.testing.assert_array_equal(ds.mean_rad.values, full.mean_rad.values[4])
+
+
+def test_variables(tmp_path, rnc):
+    full = readDMV(rnc)
+    ds = readDMV(rnc, variables=['HBBtopTemp', 'mean_rad', 'notInTheFile'])
+    assert set(ds.variables) == {'time', 'wnum1', 'HBBtopTemp', 'mean_rad'}
+    assert ds.identical(full[['HBBtopTemp', 'mean_rad']])
+    # A single name, without spectra, has no wavenumber scale.
+    assert readDMV(rnc, variables='Time').identical(full[['Time']])
+    # drop_variables leaves out exactly the named variables.
+    ds = readDMV(rnc, drop_variables=['HBBtopTemp', 'mean_rad'])
+    assert ds.identical(full.drop_vars(['HBBtopTemp', 'mean_rad']))
+    # The same selection for a file with several spectra.
+    filename = str(tmp_path / '160602F2.CXS')
+    writeDMV(filename, numberOfRecords, numberOfWavenumbers)
+    full = readDMV(filename)
+    ds = readDMV(filename, variables=['Ch2ForwardScanImagPartCounts'])
+    assert ds.identical(full[['Ch2ForwardScanImagPartCounts']])
+
+
+def test_time_range(rnc):
+    full = readDMV(rnc)
+    # Values of the time coordinate select their own records; both ends are included.
+    assert readDMV(rnc, time_range=(full.time[3], full.time[8])).sizes['time'] == 6
+    assert readDMV(rnc, time_range=(full.time.values[10], full.time.values[10])).sizes['time'] == 1
+    ds = readDMV(rnc, time_range=('2016-06-02T06:00', '2016-06-02T12:00'))
+    selection = np.flatnonzero((full.time.values >= np.datetime64('2016-06-02T06:00'))
+                               & (full.time.values <= np.datetime64('2016-06-02T12:00')))
+    assert ds.identical(full.isel(time=selection, time_offset=selection))
+    # Decimal hours of the file's day, like Time.
+    assert (readDMV(rnc, time_range=(6.0, 12.0)).Time.values == ds.Time.values).all()
+
+
+def test_wnum_range(rnc):
+    full = readDMV(rnc)
+    ds = readDMV(rnc, wnum_range=(700.0, 900.0))
+    assert ds.identical(full.sel(wnum1=slice(700.0, 900.0)))
+    ds = readDMV(rnc, wnum_range=[(600.0, 700.0), (1500.0, 1600.0)])
+    assert ds.identical(full.sel(wnum1=(((full.wnum1 >= 600.0) & (full.wnum1 <= 700.0))
+                                        | ((full.wnum1 >= 1500.0) & (full.wnum1 <= 1600.0)))))
+
+
+def test_midnight(rnc):
+    # Time wraps back to 0 at midnight after the last record of the day.
+    setTime(rnc, np.linspace(0.5, 23.9, numberOfRecords - 1).tolist() + [0.1])
+    full = readDMV(rnc)
+    last = full.time.values[-1]
+    assert abs(last - np.datetime64('2016-06-03T00:06')) < np.timedelta64(1, 'ms')
+    assert readDMV(rnc, records=slice(-1, None)).time.values[0] == last
+    assert readDMV(rnc, records=slice(-1, None)).time_offset.values[0] == full.time_offset.values[-1]
+    assert DMVFile(rnc)[-1].time.values == last
+    assert list(iterDMV(rnc, batch_records=7))[-1].time.values[-1] == last
+    assert readDMV(rnc, time_range=(full.time[-2], full.time[-1])).sizes['time'] == 2
+    # Decimal hours after midnight, before or past 24.
+    for time_range in ((0.0, 0.2), (24.0, 24.2), (23.5, 0.2)):
+        assert readDMV(rnc, time_range=time_range).time.values[-1] == last
+    assert readDMV(rnc, time_range=(0.0, 0.2)).sizes['time'] == 1
+    # A range that starts before the first record still starts on the file's day.
+    assert readDMV(rnc, time_range=(0.0, 12.0)).sizes['time'] == np.count_nonzero(full.Time.values[:-1] <= 12.0)
+    assert inspectDMV(rnc)['lastTime'] == pd.Timestamp(last)
+
+
+def test_readDMVPair_channels(tmp_path):
+    from readDMV import readDMVPair
+
+    filenames = writeDMVfiles(str(tmp_path), filetypes=('C1.RNC', 'C2.RNC'), numberOfRecords=numberOfRecords,
+                              numberOfWavenumbers=numberOfWavenumbers)
+    c1, c2 = [readDMV(filename) for filename in filenames]
+    # The spectra of channel 2 are on wnum2, whichever file is given first.
+    for filename in filenames:
+        ds = readDMVPair(filename)
+        assert ds.mean_radCh1.dims == ('time', 'wnum1')
+        assert ds.mean_radCh2.dims == ('time', 'wnum2')
+        np.testing.assert_array_equal(ds.wnum1.values, c1.wnum1.values)
+        np.testing.assert_array_equal(ds.wnum2.values, c2.wnum1.values)
+        np.testing.assert_array_equal(ds.mean_radCh1.values, c1.mean_rad.values)
+        np.testing.assert_array_equal(ds.mean_radCh2.values, c2.mean_rad.values)
+        np.testing.assert_array_equal(ds.time.values, c1.time.values)
+
+
+def test_readDMVPair_directions(tmp_path):
+    from readDMV import readDMVPair
+
+    # Identical housekeeping in both files, and different spectra.
+    backward, forward = [str(tmp_path / ('160602' + filetype)) for filetype in ('B1.RLC', 'F1.RLC')]
+    writeDMV(backward, numberOfRecords, numberOfWavenumbers)
+    writeDMV(forward, numberOfRecords, numberOfWavenumbers)
+    dataOffset = DMVfileStructure(forward, readHeader(forward))['dataOffset'][0]
+    setRecords(forward, slice(dataOffset, dataOffset + numberOfWavenumbers),
+               np.ones((numberOfRecords, numberOfWavenumbers), np.float32))
+    b1, f1 = readDMV(backward), readDMV(forward)
+
+    ds = readDMVPair(forward)
+    for name, variable in b1.data_vars.items():
+        if (variable.dims == ('time',)):
+            # Housekeeping that is the same in both files is kept once.
+            assert (name in ds) and (name + 'Backward' not in ds) and (name + 'Forward' not in ds)
+    assert 'wnum2' not in ds.dims
+    np.testing.assert_array_equal(ds.atmosphericRadianceBackward.values, b1.atmosphericRadiance.values)
+    np.testing.assert_array_equal(ds.atmosphericRadianceForward.values, f1.atmosphericRadiance.values)
+    np.testing.assert_array_equal(ds.time_offset.values, f1.time_offset.values)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_readDMVRange(tmp_path, days, workers):
+    from readDMV import readDMVRange
+
+    daily = [readDMV(filename) for filename in days]
+    perFile = ['FileHistory', 'base_time', 'date', 'time_offset']
+    expected = xr.concat([ds.drop_vars(perFile) for ds in daily], dim='time', data_vars='minimal', coords='minimal',
+                         compat='override', join='override')
+    ds = readDMVRange(str(tmp_path), '2016-06-02', '2016-06-04', 'RNC', '1', workers=workers)
+    assert ds.drop_vars(perFile).identical(expected)
+    for name in ('FileHistory', 'base_time', 'date'):
+        assert ds[name].identical(daily[0][name])
+    # time_offset continues from the first record of the first file.
+    np.testing.assert_allclose(ds.time_offset.values,
+                               (expected.time.values - expected.time.values[0]) / np.timedelta64(1, 's'))
+    np.testing.assert_array_equal(ds.time_offset.values[:numberOfRecords], daily[0].time_offset.values)
+
+    ds = readDMVRange(str(tmp_path), '2016-06-03', '2016-06-04', 'RNC', '1', variables=['mean_rad'],
+                      wnum_range=(700.0, 900.0), workers=workers)
+    np.testing.assert_array_equal(ds.mean_rad.values, expected.mean_rad.sel(wnum1=slice(700.0, 900.0))
+                                  .isel(time=slice(numberOfRecords, None)).values)
+    assert 'Latitude' not in ds
+
+
+def test_inspectDMV(tmp_path):
+    filenames = writeDMVfiles(str(tmp_path), filetypes=('C1.RNC', 'B2.CXS', '.SUM'), numberOfRecords=numberOfRecords,
+                              numberOfWavenumbers=numberOfWavenumbers)
+    for filename, fileType, channel, scanDirection in zip(filenames, ('RNC', 'CXS', 'SUM'), ('1', '2', None),
+                                                           ('Both', 'Backward', None)):
+        ds = readDMV(filename)
+        info = inspectDMV(filename)
+        assert (info['fileType'], info['channel'], info['scanDirection']) == (fileType, channel, scanDirection)
+        assert info['date'] == fileDate(filename)
+        assert info['numberOfRecords'] == ds.sizes['time']
+        assert info['fileSize'] == os.path.getsize(filename)
+        assert info['firstTime'] == pd.Timestamp(ds.time.values[0])
+        assert info['lastTime'] == pd.Timestamp(ds.time.values[-1])
+        for variable, (minimum, maximum, numberOfValues) in info['wavenumberRanges'].items():
+            wnum = ds[ds[variable].dims[1]].values
+            assert (wnum[0], wnum[-1], len(wnum)) == pytest.approx((minimum, maximum, numberOfValues))
+
+
+def test_catalog(tmp_path, days):
+    from catalogDMV import buildCatalog, queryCatalog
+
+    writeDMVfiles(str(tmp_path), date='160603', filetypes=('C2.RNC', 'F1.CXS'), numberOfRecords=numberOfRecords,
+                  numberOfWavenumbers=numberOfWavenumbers)
+    database = str(tmp_path / 'catalog.sqlite')
+    assert buildCatalog(str(tmp_path), database, workers=2, verbose=False) == 5
+    # Unchanged files are not inspected again.
+    assert buildCatalog(str(tmp_path), database, workers=2, verbose=False) == 0
+
+    rows = queryCatalog(database, fileType='RNC', channel='1', start='2016-06-03', end='2016-06-04')
+    assert [row['path'] for row in rows] == [os.path.abspath(filename) for filename in days[1:]]
+    for row, filename in zip(rows, days[1:]):
+        ds = readDMV(filename)
+        assert row['numberOfRecords'] == ds.sizes['time']
+        assert pd.Timestamp(row['firstTime']) == pd.Timestamp(ds.time.values[0])
+        assert pd.Timestamp(row['lastTime']) == pd.Timestamp(ds.time.values[-1])
+    assert [row['scanDirection'] for row in queryCatalog(database, fileType='CXS')] == ['Forward']
+    assert len(queryCatalog(database, start='2016-06-03', end='2016-06-03')) == 3
+
+
+# xarray backend
+
+def test_backend(rnc):
+    from backendDMV import DMVBackendEntrypoint
+
+    full = readDMV(rnc)
+    ds = xr.open_dataset(rnc, engine=DMVBackendEntrypoint).load()
+    assert ds.time_offset.dims == ('time',)
+    for name in ('FileHistory', 'base_time', 'date'):
+        assert ds.attrs[name] == full[name].values.item()
+    for name, variable in full.data_vars.items():
+        if ('time' in variable.dims):
+            np.testing.assert_array_equal(ds[name].values, variable.values)
+    np.testing.assert_array_equal(ds.time_offset.values, full.time_offset.values)
+
+
+def test_open_mfdataset(days):
+    from backendDMV import DMVBackendEntrypoint
+
+    pytest.importorskip('dask')
+    ds = xr.open_mfdataset(days, engine=DMVBackendEntrypoint)
+    assert dict(ds.sizes) == {'time': 63, 'wnum1': numberOfWavenumbers}
+    assert not ds.mean_rad.isnull().any()
+    expected = np.concatenate([readDMV(filename).time.values for filename in days])
+    np.testing.assert_array_equal(ds.time.values, expected)
+
+
+# Writers
+
+@pytest.mark.parametrize('first', [1, 5])
+def test_followDMV(tmp_path, rnc, first):
+    pytest.importorskip('netCDF4')
+    import netCDF4
+
+    # A new file usually has a single record when it is first polled.
+    header = readHeader(rnc)
+    recordSize = int(DMVfileStructure(rnc, header)['recordSize'])
+    data = open(rnc, 'rb').read()
+    growing = str(tmp_path / 'follow' / os.path.basename(rnc))
+    output = str(tmp_path / 'follow.nc')
+    os.makedirs(os.path.dirname(growing))
+    with open(growing, 'wb') as f:
+        f.write(data[:header.dataStart + first * recordSize])
+
+    polls = followDMV(growing, interval=0, output=output)
+    assert next(polls).sizes['time'] == first
+    with open(growing, 'ab') as f:
+        f.write(data[header.dataStart + first * recordSize:])
+    assert next(polls).sizes['time'] == numberOfRecords - first
+
+    with netCDF4.Dataset(output) as nc:
+        assert nc['mean_rad'].filters()['zlib']
+    with xr.open_dataset(output) as ds:
+        full = readDMV(rnc)
+        np.testing.assert_array_equal(ds.mean_rad.values, full.mean_rad.values)
+        np.testing.assert_array_equal(ds.time.values, full.time.values)
+
+
+def test_writeNetCDF(tmp_path, rnc):
+    pytest.importorskip('netCDF4')
+    from dmvtocdf import writeNetCDF
+
+    full = readDMV(rnc)
+    output = str(tmp_path / 'batches.nc')
+    writeNetCDF(readDMV(rnc, memmap=True), output, batch_records=1)
+    with xr.open_dataset(output) as ds:
+        np.testing.assert_array_equal(ds.time.values, full.time.values)
+        np.testing.assert_array_equal(ds.time_offset.values, full.time_offset.values)
+        np.testing.assert_array_equal(ds.mean_rad.values, full.mean_rad.values)
+
+
+def test_zarr(tmp_path, days):
+    pytest.importorskip('zarr')
+    from dmvtocdf import convertDMVtoZarr
+
+    store = str(tmp_path / 'C1.zarr')
+    results = convertDMVtoZarr([days[0], days[2]], store, verbose=False)
+    assert [result['records'] for result in results] == [20, 22]
+
+    # The same files again append nothing; the skipped day cannot be appended after them.
+    results = convertDMVtoZarr(days, store, verbose=False)
+    assert [result['records'] for result in results] == [0, 0, 0]
+    assert (results[0]['error'] is None) and (results[2]['error'] is None)
+    assert results[1]['error'].startswith('ValueError')
+
+    with xr.open_zarr(store) as ds:
+        expected = np.concatenate([readDMV(filename).time.values for filename in (days[0], days[2])])
+        np.testing.assert_array_equal(ds.time.values, expected)
+        np.testing.assert_array_equal(ds.mean_rad.values[-22:], readDMV(days[2]).mean_rad.values)
+
+
+def test_parquet(tmp_path, days):
+    pytest.importorskip('pyarrow')
+    import pyarrow.dataset as pads
+    from dmvtocdf import convertDMVtoParquet
+
+    directory = str(tmp_path / 'parquet')
+    results = convertDMVtoParquet(days, directory, verbose=False)
+    assert all(result['error'] is None for result in results)
+    # Writing a file again replaces its rows.
+    convertDMVtoParquet(days[1:2], directory, verbose=False)
+
+    # The usage example of writeParquet.
+    hk = pads.dataset(directory + '/filetype=C1.RNC', partitioning='hive')
+    table = hk.to_table(columns=['time', 'HBBtopTemp'], filter=pads.field('date') >= 20160603)
+    expected = [readDMV(filename) for filename in days[1:]]
+    order = np.argsort(table['time'].to_numpy())
+    np.testing.assert_array_equal(table['time'].to_numpy()[order],
+                                  np.concatenate([ds.time.values for ds in expected]))
+    np.testing.assert_array_equal(table['HBBtopTemp'].to_numpy()[order],
+                                  np.concatenate([ds.HBBtopTemp.values for ds in expected]))
+
+
+def test_manifest(tmp_path, days):
+    pytest.importorskip('netCDF4')
+    from dmvtocdf import convertDMVfiles
+
+    output = str(tmp_path / 'nc')
+    manifest = str(tmp_path / 'manifest.json')
+    results = convertDMVfiles(days, output, workers=1, verbose=False, manifest=manifest)
+    assert [result['filename'] for result in results] == days
+    assert all(result['error'] is None for result in results)
+    with open(manifest) as f:
+        assert sorted(json.load(f)) == sorted(os.path.abspath(filename) for filename in days)
+
+    # Unchanged files are skipped; a changed file is converted again.
+    assert convertDMVfiles(days, output, workers=1, verbose=False, manifest=manifest) == []
+    writeDMV(days[1], numberOfRecords, numberOfWavenumbers, seed=99)
+    results = convertDMVfiles(days, output, workers=1, verbose=False, manifest=manifest)
+    assert [result['filename'] for result in results] == [days[1]]
+    assert convertDMVfiles(days, output, workers=1, verbose=False, manifest=manifest, force=True) != []
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Writer for synthetic SSEC DMV files.
+
+Writes valid RNC, RFC, RLC (B, F and C), CXS, CXV and SUM files with any
+number of records and spectral points, so that readDMV and the tools built
+on it can be exercised and benchmarked without real AERI data. The header
+and TOC are written first, and the record layout is then taken from
+readDMV.DMVfileStructure and ohwhio.getDMVformatTable, so the files follow
+the same layouts that readDMV decodes.
+
+The records hold an increasing Time (decimal hours), noisy housekeeping
+values and smooth, Planck-like spectra with a little noise, so that they
+compress roughly like real data.
+
+Usage:
+    from writeDMV import writeDMV, writeDMVfiles
+    records = writeDMV('160602C1.RNC', numberOfRecords=500, numberOfWavenumbers=2048)
+    filenames = writeDMVfiles('synthetic', numberOfRecords=100)
+"""
+
+import os
+import zlib
+import struct
+import numpy as np
+from collections import OrderedDict
+
+# File types (name after the yymmdd date) that writeDMVfiles writes.
+DMVtypes = ('C1.RNC', 'C2.RNC', 'C1.RFC', 'C2.RFC',
+            'B1.RLC', 'F1.RLC', 'C1.RLC', 'B2.RLC', 'F2.RLC', 'C2.RLC',
+            'B1.CXS', 'F1.CXS', 'B2.CXS', 'F2.CXS',
+            'B1.CXV', 'F1.CXV', 'B2.CXV', 'F2.CXV',
+            '.SUM')
+
+# Wavenumber ranges (cm-1) of the two AERI channels.
+channelWavenumbers = {'1': (520.0, 1800.0), '2': (1800.0, 3020.0)}
+
+# Number of values of each wavenumber scale in SUM files; the spectra fill
+#   at most 813 of the values of the fixed-size SUM records.
+SUMwavenumbers = {'wnum1': 70, 'wnum2': 70, 'wnum3': 7, 'wnum4': 6, 'wnum11': 60, 'wnum12': 60}
+
+
+def dependentVariables(filename, numberOfWavenumbers=None):
+    """
+    Returns an OrderedDict of the dependent variables of a DMV file type,
+    in the order they are stored, with (number of values, minimum wavenumber,
+    maximum wavenumber, units) for each.
+    """
+    from ohwhio import getDMVformatTable
+
+    name = os.path.basename(filename)
+    ext = name.split('.')[-1].upper()
+    stem = name.split('.')[0]
+    channel = stem[-1:]
+    typ = stem[-2:-1]
+    nwn = numberOfWavenumbers or 2048
+    bwn, ewn = channelWavenumbers.get(channel, channelWavenumbers['1'])
+
+    variables = OrderedDict()
+    if ext in ('RNC', 'RFC', 'RLC'):
+        variables[list(getDMVformatTable(filename).wavenumberScales)[0]] = (nwn, bwn, ewn, 'mw/(m2 sr cm-1)')
+    elif (ext == 'CXS'):
+        direction = 'Backward' if (typ == 'B') else 'Forward'
+        for part in ('Real', 'Imag'):
+            variables['Ch' + channel + direction + 'Scan' + part + 'PartCounts'] = (nwn, bwn, ewn, 'counts')
+    elif (ext == 'CXV'):
+        for part in ('Real', 'Imag'):
+            variables[part + 'PartCounts'] = (nwn, bwn, ewn, 'counts')
+    elif (ext == 'SUM'):
+        for variable, scale in getDMVformatTable(filename).wavenumberScales.items():
+            bwn, ewn = channelWavenumbers['2' if variable.lower().endswith('2') else '1']
+            variables[variable] = (SUMwavenumbers[scale], bwn, ewn, 'mw/(m2 sr cm-1)')
+    else:
+        raise ValueError('Unknown DMV file type: ' + name)
+
+    # Channel 1, forward direction, CXS and CXV files carry 104 extra variables of 28 bytes each.
+    if (ext in ('CXS', 'CXV')) and (channel == '1') and (typ == 'F'):
+        for i in range(104):
+            variables['ExtraVariable{:03d}'.format(i + 1)] = (7, 0.0, 6.0, '')
+
+    return variables
+
+
+def _TOC(variables, sizeTOC):
+    """Packs the identifier and table of contents of a DMV file."""
+    toc = b'SSECRGD     ' + struct.pack('<i', sizeTOC)
+    for identifier, (variable, (nwn, bwn, ewn, units)) in enumerate(variables.items(), 1):
+        values = (nwn * 4, 1, 0, -4, bwn, ewn, -4)
+        if (sizeTOC == 40):
+            toc += struct.pack('<4i2d2i', *(values + (4,)))
+        else:
+            toc += struct.pack('<4i2d4i', *(values + (identifier, len(variables) - identifier, 4)))
+        for attribute in (variable, variable[:8], variable, units):
+            attribute = attribute.encode('utf-8')
+            toc += struct.pack('<i', len(attribute)) + attribute
+    # Number of 4-byte words that are not part of the data records, followed by those words.
+    return toc + struct.pack('<i', 0)
+
+
+def planck(wnum, temperature):
+    """Planck radiance in mw/(m2 sr cm-1) for wavenumbers wnum (cm-1) and a temperature in K."""
+    return 1.191042e-5 * wnum ** 3 / np.expm1(1.4387752 * wnum / temperature)
+
+
+def writeDMV(filename, numberOfRecords=100, numberOfWavenumbers=None, seed=0):
+    """
+    Writes a synthetic DMV file. The type of file is taken from its name,
+    e.g. 160602C1.RNC, 110602F2.CXS or 160602.SUM, just as in readDMV.
+
+    Input:
+        filename            - DMV file name
+        numberOfRecords     - number of data records
+        numberOfWavenumbers - number of values in each spectrum (default: 2048;
+                              SUM files always use SUMwavenumbers)
+        seed                - seed of the random numbers; an int, or a sequence
+                              of ints (see numpy.random.default_rng)
+
+    Output:
+        The data records that were written, a float32 array of shape
+        (numberOfRecords, number of values per record).
+    """
+    from readDMV import readHeader, DMVfileStructure
+
+    rng = np.random.default_rng(seed)
+    variables = dependentVariables(filename, numberOfWavenumbers)
+    sizeTOC = 40 if filename.split('.')[-1].upper() in ('RNC', 'RFC', 'RLC') else 48
+
+    # Header; its first line gives the size of the header in bytes.
+    history = ('Synthetic DMV file written by writeDMV.py\n'
+               'numberOfRecords = {}\n'.format(numberOfRecords))
+    headerSize = len(history) + 10
+    header = '{:<9d}\n'.format(headerSize) + history
+
+    with open(filename, 'wb') as f:
+        f.write(header.encode('utf-8'))
+        f.write(_TOC(variables, sizeTOC))
+
+    # The layout of the records follows from the header and TOC, exactly as readDMV sees them.
+    fileStructure = DMVfileStructure(filename, readHeader(filename))
+    if not fileStructure:
+        raise ValueError('Unknown DMV file type: ' + filename)
+    records = np.zeros((numberOfRecords, fileStructure['numberOfValues']), np.float32)
+
+    # Housekeeping values, then an increasing Time of day in decimal hours.
+    variableOffset = fileStructure['variableOffset']
+    numberOfVariables = fileStructure['numberOfVariables']
+    records[:, variableOffset:variableOffset + numberOfVariables] = rng.normal(
+        300.0, 10.0, (numberOfRecords, numberOfVariables))
+    records[:, variableOffset] = (np.arange(numberOfRecords) + 0.5) * 24.0 / max(numberOfRecords, 1)
+
+    # Smooth spectra with a little noise; the layout of the TOC, including any extra variables.
+    offset = fileStructure['dataOffset'][0]
+    temperature = rng.normal(270.0, 5.0, (numberOfRecords, 1))
+    for variable, (nwn, bwn, ewn, units) in variables.items():
+        wnum = np.linspace(bwn, ewn, nwn)
+        spectrum = planck(wnum, temperature) if units else rng.normal(0.0, 1.0, (numberOfRecords, nwn))
+        if ('ImagPart' in variable):
+            spectrum = 0.01 * spectrum
+        records[:, offset:offset + nwn] = spectrum * (1.0 + 0.001 * rng.standard_normal((numberOfRecords, nwn)))
+        offset += nwn
+
+    with open(filename, 'ab') as f:
+        f.write(records.tobytes())
+
+    return records
+
+
+def writeDMVfiles(directory, date='160602', filetypes=DMVtypes, numberOfRecords=100, numberOfWavenumbers=None,
+                  seed=0):
+    """
+    Writes one synthetic DMV file of each of filetypes (see DMVtypes) for
+    date (yymmdd) into directory, and returns their file names. Each file's
+    random numbers are seeded from seed, the date and its type, so that no
+    two files have the same data (e.g. a B1 and F1 pair) and a file does not
+    depend on the other types that are written with it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    filenames = []
+    for filetype in filetypes:
+        filename = os.path.join(directory, date + filetype)
+        writeDMV(filename, numberOfRecords, numberOfWavenumbers,
+                 [seed, zlib.crc32((date + filetype).encode('utf-8'))])
+        filenames.append(filename)
+
+    return filenames